@@ -0,0 +1,164 @@
+"""
+Title: Coil_Adaptive_Search
+
+Finds the best coils of a fine grid (e.g. 1 um trace width and spacing steps) without sweeping
+all of it. A coarse lattice of the grid is swept first, then the neighbourhoods of the best
+geometries, ranked like top_five_options and optionally also the Pareto frontier, are swept at the
+same step until no neighbour is new, the step is halved and so on down to single grid steps.
+The best coils sit on the feasibility edge (inner diameter close to 0), which a lattice and its
+neighbourhoods keep missing, so the last feasible turn of every width/spacing pair, known in
+closed form, is swept in the first round too. That is one geometry per pair, about 7% of the
+candidate geometries at 1 um steps.
+Only the points swept are evaluated, through the normal pipeline stages, and their number is
+reported next to the size of the grid so the saving can be checked.
+
+python Coil_Adaptive_Search.py --diameter 20 --resolution 1
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+import Coil_Parameter_Selection as cps
+from Coil_Selection import pareto_front, pareto_index, top_k, top_k_index
+
+
+def fine_params(resolution=1, **overrides):
+    """sweep_params with the default trace width and spacing ranges in steps of resolution um."""
+    widths = cps.trace_width_range
+    spacings = cps.trace_spacing_range
+    params = cps.sweep_params(
+        trace_widths=range(widths.start, widths[-1] + 1, resolution),
+        trace_spacings=range(spacings.start, spacings[-1] + 1, resolution))
+    params.update(overrides)
+    return params
+
+def _grid_shape(params):
+    widths, spacings, turns = cps.sweep_axes(params)
+    return len(widths), len(spacings), len(turns)
+
+def _geometry_ids(df, params):
+    # Flat (width, spacing, turn) grid index of every row, read back from its coil number
+    return (df['CSV_CoilNumber'].to_numpy() - 1) // len(params['capacitance_tank'])
+
+def _lattice(shape, steps):
+    # Every steps-th point along each axis, the last point of the axis included
+    axes = [np.union1d(np.arange(0, n, step), [n - 1]) for n, step in zip(shape, steps)]
+    return np.ravel_multi_index([axis.ravel() for axis in np.meshgrid(*axes, indexing='ij')], shape)
+
+def _neighbours(ids, steps, shape):
+    # The points one step away (diagonals included) from each of ids, inside the grid
+    offsets = np.stack(np.meshgrid(*[(-step, 0, step) for step in steps], indexing='ij'), axis=-1).reshape(-1, 3)
+    points = (np.stack(np.unravel_index(ids, shape), axis=1)[:, None, :] + offsets[None, :, :]).reshape(-1, 3)
+    points = points[((points >= 0) & (points < np.array(shape))).all(axis=1)]
+    return np.unique(np.ravel_multi_index(points.T, shape))
+
+def _candidates(params, ids, shape):
+    # Drop turns past the point where the inner diameter is sure to be negative (see candidate_counts)
+    tw_idx, ts_idx, turn_idx = np.unravel_index(ids, shape)
+    return ids[turn_idx < cps.candidate_counts(params, tw_idx * shape[1] + ts_idx)]
+
+def _edge_turns(params, pairs):
+    # Index of the last feasible turn of each width/spacing pair, -1 if there is none. The feasible
+    # turns are a prefix and end where the inner diameter leaves less than min_coil_fill_ratio, the
+    # closed form estimate is checked on the turns either side with the stages' arithmetic.
+    widths, spacings, turns = cps.sweep_axes(params)
+    tw_idx, ts_idx = np.divmod(pairs, len(spacings))
+    tw, ts = widths[tw_idx], spacings[ts_idx]
+    od = params['outer_diameter']
+    min_inner = params['min_coil_fill_ratio'] * od / (1000 * 1000)
+    estimate = np.searchsorted(turns, (od - min_inner) / (2 * (tw + ts)), side='right') - 1
+    edge = np.full(len(pairs), -1)
+    for turn_idx in (estimate - 1, estimate, estimate + 1):
+        inside = (turn_idx >= 0) & (turn_idx < len(turns))
+        turn_idx = np.clip(turn_idx, 0, len(turns) - 1)
+        inner = np.trunc(cps.calculate_inner_diameter(tw, ts, turns[turn_idx], od))
+        cfr = np.trunc(cps.calculate_coil_fill_ratio(od, inner))
+        edge = np.where(inside & (inner >= 0) & (cfr >= params['min_coil_fill_ratio']), np.maximum(edge, turn_idx), edge)
+    return edge
+
+def _edges(params, shape):
+    # Geometry ids of the last feasible turn of every width/spacing pair
+    pairs = np.arange(shape[0] * shape[1])
+    edge = _edge_turns(params, pairs)
+    return pairs[edge >= 0] * shape[2] + edge[edge >= 0]
+
+def _best_geometries(df, params, by, keep, pareto):
+    # The keep best distinct geometries by `by`, plus every geometry on the Pareto frontier
+    ids = _geometry_ids(df, params)
+    order = top_k_index(df, list(by), keep * len(params['capacitance_tank']))
+    best = pd.unique(ids[order])[:keep]
+    if pareto:
+        best = np.union1d(best, ids[pareto_index(df)])
+    return best
+
+def adaptive_search(params=None, coarse_steps=(16, 16, 4), keep=10, by=cps.TOP_OPTIONS_BY, top_n=5, pareto=False, stages=cps.PIPELINE_STAGES):
+    """Best coils of the grid in params found by coarse-to-fine refinement.
+
+    coarse_steps are the first steps in grid points along the trace width, trace spacing and turn
+    axes. The keep best geometries by `by` (largest first) are refined, with pareto=True the Pareto
+    frontier is refined as well. Returns a summary dict with the top_n rows, the frontier, every row
+    evaluated and the counts: geometries evaluated against the candidate geometries a sweep would run.
+    """
+    if params is None:
+        params = fine_params()
+    shape = _grid_shape(params)
+    num_caps = len(params['capacitance_tank'])
+    steps = np.asarray(coarse_steps)
+    tried = np.empty(0, dtype=np.int64)   # Geometry ids evaluated so far, sorted
+    evaluated = None
+    rounds = 0
+    ids = _lattice(shape, steps)
+    edges = _edges(params, shape)
+    while True:
+        ids = np.setdiff1d(_candidates(params, np.union1d(ids, edges), shape), tried)
+        if len(ids):
+            tried = np.union1d(tried, ids)
+            df = cps.sweep_points(params, *np.unravel_index(ids, shape), stages=stages)
+            evaluated = df if evaluated is None else pd.concat([evaluated, df], ignore_index=True)
+            rounds += 1
+        elif steps.max() == 1:
+            break
+        else:
+            steps = np.maximum(steps // 2, 1)
+        if evaluated is None or len(evaluated) == 0:
+            if steps.max() == 1:
+                break
+            ids = _lattice(shape, steps)
+            continue
+        ids = _neighbours(_best_geometries(evaluated, params, by, keep, pareto), steps, shape)
+    if evaluated is None:
+        evaluated = cps.sweep_points(params, [], [], [], stages=stages)
+    return {
+        'grid_rows': int(np.prod(shape)) * num_caps,
+        'candidate_geometries': int(cps.candidate_counts(params, np.arange(shape[0] * shape[1])).sum()),
+        'evaluations': len(tried),
+        'rows': len(evaluated),
+        'rounds': rounds,
+        'top': top_k(evaluated, list(by), top_n),
+        'pareto': pareto_front(evaluated) if pareto else None,
+        'evaluated': evaluated,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Coarse-to-fine search for the best coils of a fine grid")
+    parser.add_argument('--diameter', type=float, default=cps.input_outter_diameter, help="Outer diameter in mm")
+    parser.add_argument('--resolution', type=int, default=1, help="Trace width/spacing step in um")
+    parser.add_argument('--coarse-steps', type=int, nargs=3, default=(16, 16, 4), help="First steps along width, spacing and turns, in grid points")
+    parser.add_argument('--keep', type=int, default=10, help="Best geometries refined every round")
+    parser.add_argument('--top', type=int, default=5, help="Coils printed")
+    parser.add_argument('--pareto', action='store_true', help="Refine around the Pareto frontier too")
+    args = parser.parse_args(argv)
+
+    params = fine_params(args.resolution, outer_diameter=int(round(args.diameter * 1000)))
+    result = adaptive_search(params, args.coarse_steps, args.keep, top_n=args.top, pareto=args.pareto)
+    print(f"{result['evaluations']} geometries evaluated in {result['rounds']} rounds, "
+          f"a sweep runs {result['candidate_geometries']} (grid of {result['grid_rows']} rows)")
+    print(result['top'])
+    if args.pareto:
+        print(f"{len(result['pareto'])} coils on the Pareto frontier of the coils evaluated:")
+        print(result['pareto'])
+
+
+if __name__ == "__main__":
+    main()
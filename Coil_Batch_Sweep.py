@@ -0,0 +1,136 @@
+"""
+Title: Coil_Batch_Sweep
+
+Runs the coil sweep for a family of specs (board size, copper weight, parameter ranges) across a
+process pool, one spec per worker. Each worker streams its sweep (Coil_Parameter_Selection.stream_sweep)
+so its memory is bounded by chunk_rows, and can also be capped hard with memory_limit_mb.
+Every spec gets its own result store and the per-spec top coils are merged into one leaderboard.
+
+A spec is a dict of sweep_params settings plus an optional name, lengths in um:
+{"name": "20mm_1oz", "outer_diameter": 20000, "copper_thickness": 34.79,
+ "trace_widths": {"start": 150, "stop": 1010, "step": 10}, "capacitance_tank": [100, 220, 470]}
+Ranges are given as {"start", "stop", "step"} or as a list of values.
+
+python Coil_Batch_Sweep.py --diameters 10 15 20 --copper 17.5 34.79 --workers 4
+python Coil_Batch_Sweep.py --specs specs.json --output-dir sweeps
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+import Coil_Parameter_Selection as cps
+from Coil_Result_Store import STORE_SUFFIX
+from Coil_Selection import top_k
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, memory_limit_mb is ignored there
+    resource = None
+
+
+RANGE_KEYS = ('trace_widths', 'trace_spacings', 'turns')
+
+
+def make_specs(diameters_mm, copper_thicknesses=(cps.copper_thickness,), **overrides):
+    """One spec per (outer diameter in mm, copper thickness in um) combination."""
+    specs = []
+    for diameter in diameters_mm:
+        for copper in copper_thicknesses:
+            spec = {'name': f'{diameter:g}mm_{copper:g}um', 'outer_diameter': int(round(diameter * 1000)), 'copper_thickness': copper}
+            spec.update(overrides)
+            specs.append(spec)
+    return specs
+
+def load_specs(path):
+    with open(path) as f:
+        return json.load(f)
+
+def spec_name(spec):
+    return spec.get('name') or f"{spec['outer_diameter'] / 1000:g}mm_{spec.get('copper_thickness', cps.copper_thickness):g}um"
+
+def spec_params(spec):
+    """sweep_params for a spec, {"start", "stop", "step"} dicts become ranges."""
+    overrides = {key: value for key, value in spec.items() if key != 'name'}
+    for key in RANGE_KEYS:
+        if isinstance(overrides.get(key), dict):
+            overrides[key] = range(overrides[key]['start'], overrides[key]['stop'], overrides[key].get('step', 1))
+    unknown = set(overrides) - set(cps.sweep_params())
+    if unknown:
+        raise KeyError(f"Unknown spec setting(s) in {spec_name(spec)}: {', '.join(sorted(unknown))}")
+    return cps.sweep_params(**overrides)
+
+
+def _limit_memory(memory_limit_mb):
+    # Pool initializer, caps the address space of each worker process
+    if memory_limit_mb and resource is not None:
+        limit = int(memory_limit_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def run_spec(spec, output_dir='.', chunk_rows=None, top_n=10, top_by=cps.TOP_OPTIONS_BY):
+    """Stream one spec's sweep into <output_dir>/<name>.coils and return its summary."""
+    name = spec_name(spec)
+    output = os.path.join(output_dir, name + STORE_SUFFIX) if output_dir is not None else None
+    summary = cps.stream_sweep(spec_params(spec), output=output, chunk_rows=chunk_rows, top_n=top_n, top_by=top_by)
+    summary['name'] = name
+    summary['output'] = output
+    return summary
+
+def run_batch(specs, output_dir='.', workers=None, chunk_rows=None, memory_limit_mb=None, top_n=10, top_by=cps.TOP_OPTIONS_BY, leaderboard_file=None):
+    """Run every spec on a process pool.
+
+    Returns the per-spec summaries (in spec order) and the combined leaderboard: the top_n
+    coils over all specs by top_by, with a Spec column naming the spec each one came from.
+    """
+    names = [spec_name(spec) for spec in specs]
+    if len(set(names)) != len(names):
+        raise ValueError("Spec names must be unique, they are used for the output files")
+    for spec in specs:
+        spec_params(spec)                           # Fail on bad specs before starting any workers
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, len(specs)) or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_limit_memory, initargs=(memory_limit_mb,)) as pool:
+        futures = [pool.submit(run_spec, spec, output_dir, chunk_rows, top_n, top_by) for spec in specs]
+        summaries = [future.result() for future in futures]
+    tops = []
+    for summary in summaries:
+        if summary['top'] is not None:
+            top = summary['top'].copy()
+            top.insert(0, 'Spec', summary['name'])
+            tops.append(top)
+    leaderboard = top_k(pd.concat(tops, ignore_index=True), list(top_by), top_n) if tops else pd.DataFrame()
+    if leaderboard_file is not None:
+        leaderboard.to_csv(leaderboard_file, index=False)
+    return summaries, leaderboard
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run coil sweeps for several board sizes and copper weights in parallel")
+    parser.add_argument('--specs', help="JSON file with a list of specs")
+    parser.add_argument('--diameters', type=float, nargs='+', help="Outer diameters in mm")
+    parser.add_argument('--copper', type=float, nargs='+', default=[cps.copper_thickness], help="Copper thicknesses in um")
+    parser.add_argument('--output-dir', default='.', help="Directory for the per-spec result stores")
+    parser.add_argument('--workers', type=int, help="Worker processes, defaults to the number of cores")
+    parser.add_argument('--chunk-rows', type=int, default=cps.stream_chunk_rows, help="Rows per chunk in each worker")
+    parser.add_argument('--memory-limit-mb', type=int, help="Hard address space limit per worker")
+    parser.add_argument('--top', type=int, default=10, help="Size of the per-spec top list and the leaderboard")
+    parser.add_argument('--leaderboard', default='leaderboard.csv', help="csv file for the combined leaderboard")
+    args = parser.parse_args(argv)
+
+    specs = load_specs(args.specs) if args.specs else []
+    if args.diameters:
+        specs += make_specs(args.diameters, args.copper)
+    if not specs:
+        parser.error("give --specs and/or --diameters")
+    summaries, leaderboard = run_batch(specs, args.output_dir, args.workers, args.chunk_rows, args.memory_limit_mb,
+                                       args.top, leaderboard_file=os.path.join(args.output_dir, args.leaderboard))
+    for summary in summaries:
+        print(f"{summary['name']}: {summary['rows']} coils -> {summary['output']}")
+    print(f"Top {len(leaderboard)} coils over all specs:")
+    print(leaderboard)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Title: Coil_Benchmark
+
+Reproducible benchmark of the sweep pipeline over fixed grids, with a per-stage profile (wall time,
+rows in/out/pruned, peak traced memory) written as a JSON report, and a comparison of two reports
+that flags stages which got slower.
+
+Suites (20 mm pad unless noted):
+small    10 mm pad, 40 um width/spacing steps
+default  the sweep_params defaults, 10 um steps
+dense    2 um width/spacing steps
+
+Every suite is streamed (Coil_Parameter_Selection.stream_sweep) without writing output. Timings are
+the best of `repeat` runs, memory is measured in one extra run under tracemalloc because tracing
+slows the stages down.
+
+python Coil_Benchmark.py --suites small default --output bench.json
+python Coil_Benchmark.py --compare before.json after.json --threshold 0.1
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+import Coil_Parameter_Selection as cps
+from Coil_Adaptive_Search import fine_params
+from Coil_Result_Store import params_json
+
+
+SUITES = {
+    'small': lambda: cps.sweep_params(outer_diameter=10000, trace_widths=range(150, 1010, 40), trace_spacings=range(150, 301, 40)),
+    'default': lambda: cps.sweep_params(),
+    'dense': lambda: fine_params(2),
+}
+
+
+def _stream(params, chunk_rows):
+    start = time.perf_counter()
+    summary = cps.stream_sweep(params, chunk_rows=chunk_rows, top_n=0)
+    return time.perf_counter() - start, summary
+
+def run_suite(name, repeat=3, chunk_rows=None, trace_memory=True):
+    """Profile of one suite: totals plus a dict per stage."""
+    params = SUITES[name]()
+    runs = [_stream(params, chunk_rows) for _ in range(repeat)]
+    seconds, summary = min(runs, key=lambda run: run[0])
+    stages = {stage: dict(counts) for stage, counts in summary['filter_counts'].items()}
+    for stage in stages:
+        stages[stage]['seconds'] = min(run[1]['filter_counts'][stage]['seconds'] for run in runs)
+    peak_bytes = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            _, traced = _stream(params, chunk_rows)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        for stage, counts in traced['filter_counts'].items():
+            stages[stage]['peak_bytes'] = counts.get('peak_bytes')
+    return {
+        'params': params_json(params),
+        'grid_rows': summary['grid_rows'],
+        'candidate_rows': summary['candidate_rows'],
+        'rows': summary['rows'],
+        'chunks': summary['chunks'],
+        'seconds': seconds,
+        'peak_bytes': peak_bytes,
+        'stages': stages,
+    }
+
+def run_benchmark(suites=('small', 'default', 'dense'), repeat=3, chunk_rows=None, trace_memory=True):
+    """Report dict for the suites named, see run_suite."""
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.platform(),
+        'repeat': repeat,
+        'suites': {name: run_suite(name, repeat, chunk_rows, trace_memory) for name in suites},
+    }
+
+def save_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare_reports(old, new, threshold=0.1, min_seconds=0.005):
+    """One row per suite and stage found in both reports, ratio is new / old seconds.
+
+    A row regressed when it is more than threshold (relative) and min_seconds slower, so timer
+    noise on sub-millisecond stages does not count, or when the stage counts changed, which
+    means the two runs did not do the same work.
+    """
+    rows = []
+    for suite, new_suite in new['suites'].items():
+        old_suite = old['suites'].get(suite)
+        if old_suite is None:
+            continue
+        timings = [('total', old_suite, new_suite)]
+        timings += [(stage, old_suite['stages'][stage], counts) for stage, counts in new_suite['stages'].items() if stage in old_suite['stages']]
+        for stage, old_counts, new_counts in timings:
+            ratio = new_counts['seconds'] / old_counts['seconds'] if old_counts['seconds'] else float('nan')
+            same_work = all(old_counts.get(count) == new_counts.get(count) for count in ('rows_in', 'rows_out', 'rows'))
+            rows.append({
+                'suite': suite,
+                'stage': stage,
+                'old_seconds': old_counts['seconds'],
+                'new_seconds': new_counts['seconds'],
+                'ratio': ratio,
+                'regressed': bool(ratio > 1 + threshold and new_counts['seconds'] - old_counts['seconds'] > min_seconds) or not same_work,
+            })
+    return pd.DataFrame(rows, columns=['suite', 'stage', 'old_seconds', 'new_seconds', 'ratio', 'regressed'])
+
+def print_report(report):
+    for suite, result in report['suites'].items():
+        peak = f", peak {result['peak_bytes'] / 2 ** 20:.1f} MiB" if result['peak_bytes'] is not None else ""
+        print(f"{suite}: {result['rows']} rows of {result['grid_rows']} in {result['seconds']:.3f} s{peak}")
+        print(pd.DataFrame.from_dict(result['stages'], orient='index').to_string())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and profile the coil sweep pipeline")
+    parser.add_argument('--suites', nargs='+', choices=list(SUITES), default=list(SUITES), help="Suites to run")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per suite, the best one is kept")
+    parser.add_argument('--chunk-rows', type=int, default=cps.stream_chunk_rows, help="Rows per streamed chunk")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc run")
+    parser.add_argument('--output', help="Write the JSON report here")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two reports instead of running")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Relative slowdown counted as a regression")
+    parser.add_argument('--min-seconds', type=float, default=0.005, help="Smaller slowdowns are not counted")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        comparison = compare_reports(load_report(args.compare[0]), load_report(args.compare[1]), args.threshold, args.min_seconds)
+        print(comparison.to_string(index=False))
+        regressed = comparison[comparison['regressed']]
+        if len(regressed):
+            print(f"{len(regressed)} regression(s)")
+            return 1
+        return 0
+    report = run_benchmark(args.suites, args.repeat, args.chunk_rows, not args.no_memory)
+    print_report(report)
+    if args.output:
+        save_report(report, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
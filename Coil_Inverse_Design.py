@@ -0,0 +1,172 @@
+"""
+Title: Coil_Inverse_Design
+
+Goes straight from a target sensor frequency (and optionally an inductance range) to the coils of
+the sweep grid that hit it, without running the full grid.
+The frequency band becomes an inductance band per tank cap, L = 1/((2 pi f)^2 C). The array model
+of the inductance (the stage arithmetic on numpy arrays, truncation included, no stages run) gives
+every candidate turn of every trace width/spacing pair at once, pairs whose turns all miss the
+union of the bands are dropped there. The stages (Coil_Parameter_Selection.PIPELINE_STAGES) then
+only run on the turns the model puts inside a band and the turn either side of each, and the rows
+are kept on the stage values, so the matches are exactly the rows a full sweep would give.
+The stages still evaluate about three geometries per matching one, so a wide band that most of the
+grid falls into saves little.
+
+python Coil_Inverse_Design.py --diameter 20 --freq 2e6 --tolerance 0.05
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+import Coil_Parameter_Selection as cps
+
+
+def stages_for(column, stages=cps.PIPELINE_STAGES):
+    """The stages (in order) needed to make column."""
+    needed = {column}
+    chain = []
+    for stage in reversed(stages):
+        if stage.column in needed:
+            chain.append(stage)
+            needed.update(stage.inputs)
+    return chain[::-1]
+
+def _model_inductance(params, tw, ts, turns):
+    # The arithmetic of the stages up to the inductance on arrays, integer truncation included.
+    # Only used to pick the geometries the stages run on, so it does not drop anything itself.
+    od = params['outer_diameter']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inner = np.trunc(cps.calculate_inner_diameter(tw, ts, turns, od))
+        avg = np.trunc(cps.calculate_avg_diameter(inner, od))
+        cfr = np.trunc(cps.calculate_coil_fill_ratio(od, inner))
+        return np.trunc(cps.calculate_total_inductance_array(turns, avg, cfr, **params['inductance_fit']))
+
+def _exact_inductance(params, stages, tw, ts, turns):
+    # CSV_CoilInductance from the stages for each geometry, NaN where a stage drops it
+    df = pd.DataFrame({
+        'CSV_CoilNumber': np.zeros(len(tw), dtype=np.int64),
+        'CSV_OutterDiameter': np.full(len(tw), params['outer_diameter']),
+        'CSV_TraceWidth': tw,
+        'CSV_TraceSpacing': ts,
+        'CSV_TurnsPerLayer': turns,
+        '_cell': np.arange(len(tw))})
+    out = cps.run_pipeline(df, stages=stages_for('CSV_CoilInductance', stages), params=params)
+    inductance = np.full(len(tw), np.nan)
+    inductance[out['_cell'].to_numpy()] = out['CSV_CoilInductance'].to_numpy()
+    return inductance
+
+def _in_bands(inductance, cap_low, cap_high):
+    # (values x caps) mask of the values inside each cap's inductance band
+    with np.errstate(invalid='ignore'):
+        return (inductance[:, None] >= cap_low[None, :]) & (inductance[:, None] <= cap_high[None, :])
+
+def frequency_to_inductance(freq_band, tank_cap):
+    """(low, high) CSV_CoilInductance (pH) giving a CSV_SensorFreq inside freq_band with tank_cap (pF)."""
+    f_low, f_high = freq_band
+    tank_cap = np.asarray(tank_cap, dtype=float)
+    return (1e12 / (2 * np.pi * f_high)) ** 2 / tank_cap, (1e12 / (2 * np.pi * f_low)) ** 2 / tank_cap
+
+def solve_coils(freq_band=None, target_freq=None, freq_tolerance=0.05, inductance_band=None, params=None,
+                stages=cps.PIPELINE_STAGES, block_pairs=4096, stats=None, margin=1e-6):
+    """Coils of the sweep grid with CSV_SensorFreq inside freq_band (inclusive).
+
+    freq_band can be given as target_freq +/- freq_tolerance (relative) instead, in the units of
+    CSV_SensorFreq. inductance_band optionally limits CSV_CoilInductance too, either side can be
+    None. Returns the matching rows with every pipeline column, the same rows (and coil numbers)
+    run_sweep would give after filtering. The stages only run on the turns whose model inductance
+    is inside a cap's band, widened by margin (relative), and the turns either side of those. If
+    stats is a dict, the geometries the stages evaluated, the candidate geometries a sweep would
+    evaluate and the size of the grid are added to it.
+    """
+    if params is None:
+        params = cps.sweep_params()
+    if freq_band is None:
+        if target_freq is None:
+            raise ValueError("Give freq_band or target_freq")
+        freq_band = (target_freq * (1 - freq_tolerance), target_freq * (1 + freq_tolerance))
+    f_low, f_high = freq_band
+    l_low, l_high = inductance_band if inductance_band is not None else (None, None)
+    widths, spacings, turns = cps.sweep_axes(params)
+    caps = np.asarray(params['capacitance_tank'])
+    # Inductance band per cap, narrowed by inductance_band
+    cap_low, cap_high = frequency_to_inductance(freq_band, caps)
+    if l_low is not None:
+        cap_low = np.maximum(cap_low, l_low)
+    if l_high is not None:
+        cap_high = np.minimum(cap_high, l_high)
+    cap_low, cap_high = cap_low * (1 - margin), cap_high * (1 + margin)
+    num_pairs = len(widths) * len(spacings)
+    evaluations = 0
+    candidates_total = 0
+    found = []
+    for block_start in range(0, num_pairs, block_pairs):
+        pairs = np.arange(block_start, min(block_start + block_pairs, num_pairs))
+        counts = cps.candidate_counts(params, pairs)
+        candidates_total += int(counts.sum())
+        # Model inductance of every candidate (pair, turn), pairs whose turns miss every band drop out here
+        valid = np.arange(len(turns))[None, :] < counts[:, None]
+        tw = widths[pairs // len(spacings)][:, None]
+        ts = spacings[pairs % len(spacings)][:, None]
+        model = np.where(valid, _model_inductance(params, tw, ts, turns[None, :]), np.nan)
+        near = _in_bands(model.ravel(), cap_low, cap_high).any(axis=1).reshape(model.shape)
+        if not near.any():
+            continue
+        # The stages run on those turns and their neighbours, in case the model is off by one
+        near[:, 1:] |= near[:, :-1].copy()
+        near[:, :-1] |= near[:, 1:].copy()
+        pair_rows, turn_idx = np.nonzero(near & valid)
+        pair = pairs[pair_rows]
+        inductance = _exact_inductance(params, stages, widths[pair // len(spacings)], spacings[pair % len(spacings)], turns[turn_idx])
+        evaluations += len(pair)
+        # One row per geometry and cap whose (widened) band its exact inductance is in
+        cell, cap_idx = np.nonzero(_in_bands(inductance, cap_low, cap_high))
+        pair, turn_idx = pair[cell], turn_idx[cell]
+        found.append(pd.DataFrame({
+            'CSV_CoilNumber': ((pair * len(turns) + turn_idx) * len(caps)) + cap_idx + 1,
+            'CSV_OutterDiameter': np.full(len(cell), params['outer_diameter']),
+            'CSV_TraceWidth': widths[pair // len(spacings)],
+            'CSV_TraceSpacing': spacings[pair % len(spacings)],
+            'CSV_TurnsPerLayer': turns[turn_idx],
+            'CSV_TankCap': caps[cap_idx]}))
+    candidates = pd.concat(found, ignore_index=True) if found else pd.DataFrame()
+    if len(candidates):
+        # The stage values decide, the widened bands only chose the rows to run
+        coils = cps.run_pipeline(candidates.sort_values('CSV_CoilNumber', ignore_index=True), stages=stages, params=params)
+        keep = (coils['CSV_SensorFreq'] >= f_low) & (coils['CSV_SensorFreq'] <= f_high)
+        if l_low is not None:
+            keep &= coils['CSV_CoilInductance'] >= l_low
+        if l_high is not None:
+            keep &= coils['CSV_CoilInductance'] <= l_high
+        coils = cps.sweep_columns(coils[keep].reset_index(drop=True), stages)
+    else:
+        coils = cps.sweep_points(params, [], [], [], stages=stages)
+    if stats is not None:
+        stats['evaluations'] = stats.get('evaluations', 0) + evaluations
+        stats['candidate_geometries'] = stats.get('candidate_geometries', 0) + candidates_total
+        stats['grid_rows'] = stats.get('grid_rows', 0) + len(widths) * len(spacings) * len(turns) * len(caps)
+        stats['matches'] = stats.get('matches', 0) + len(coils)
+    return coils
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the coils that resonate at a target sensor frequency")
+    parser.add_argument('--diameter', type=float, default=cps.input_outter_diameter, help="Outer diameter in mm")
+    parser.add_argument('--freq', type=float, required=True, help="Target sensor frequency")
+    parser.add_argument('--tolerance', type=float, default=0.05, help="Relative frequency tolerance")
+    parser.add_argument('--min-inductance', type=float, help="Lowest CSV_CoilInductance")
+    parser.add_argument('--max-inductance', type=float, help="Highest CSV_CoilInductance")
+    parser.add_argument('--output', help="Write the matches to this csv file or result store")
+    args = parser.parse_args(argv)
+
+    stats = {}
+    params = cps.sweep_params(outer_diameter=int(round(args.diameter * 1000)))
+    coils = solve_coils(target_freq=args.freq, freq_tolerance=args.tolerance, inductance_band=(args.min_inductance, args.max_inductance),
+                        params=params, stats=stats)
+    print(f"{stats['matches']} coils found, {stats['evaluations']} of {stats['candidate_geometries']} candidate geometries evaluated (grid of {stats['grid_rows']} rows)")
+    print(coils)
+    if args.output:
+        cps.save_table(coils, args.output, params)
+
+
+if __name__ == "__main__":
+    main()
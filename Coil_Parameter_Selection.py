@@ -20,12 +20,19 @@ length_in_meters = length_in_micrometers / 1e6
 """
 import math
 import csv
+import time
+import tracemalloc
+from collections import namedtuple
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import scipy
 import sympy as sp
+from Coil_Result_Cache import ROWS_KEY, ResultCache, hash_values, key_table, stage_key
+from Coil_Query_Engine import SweepIndex
+from Coil_Result_Store import StoreWriter, load_table, save_table, store_params
+from Coil_Selection import merge_top_k, pareto_front, top_k, top_k_index
 
 
 """ Variables """
@@ -34,12 +41,18 @@ input_outter_diameter = 20  # Set default value for out_diameter
 
 # CSV Creation
 csv_file_name = 'coil_parameters_20mm.csv'
+results_file_name = 'coil_parameters_20mm.coils'  # Columnar result store, see Coil_Result_Store
 coil_number = 0  # Number of the coil in the CSV file
 trace_width = 0  # Script will create a range of trace widths from 0.15mm(min) to 1mm(max) in steps of 0.01mm
 trace_spacing = 0  # Create a range of trace spacings from 0.15mm(min) to 0.3mm(max) in steps of 0.01mm
 turns_per_layer = 0  # Turns per layer of the coil from 1(min) to 120(max) in steps of 1(always a whole number)
 capacitance_tank = [10, 15, 22, 33, 47, 68, 100, 150, 220, 330, 470, 680, 1000, 1500, 2200, 3300, 4700, 6800, 10000]
 # The external capacitor simulated from 10pF to 10000pF in standard EIA-96 code values
+trace_width_range = range(150, 1010, 10)  # 0.15mm to 1mm in steps of 0.01mm
+trace_spacing_range = range(150, 301, 10)  # 0.15mm to 0.3mm in steps of 0.01mm
+turns_range = range(1, 121)  # 1 to 120
+stream_chunk_rows = 1000000  # Rows per chunk when the sweep is streamed
+cache_dir = '.coil_cache'  # Stage results are cached here so reruns only recompute what changed
 
 # Calculations
 inner_diameter = 0  # Calculated from the trace_width, trace_spacing & turns_per_layer from the out_diameter
@@ -57,6 +70,24 @@ total_inductance = 0  # The
 # Boundaries
 min_coil_fill_ratio = 0.3
 
+# Copper
+copper_thickness = 34.79  # Trace height in um (1oz copper)
+
+# Fit constants of the inductance approximation used by calculate_total_inductance
+C1 = 1.27
+C2 = 2.07
+C3 = 0.18
+C4 = 0.13
+
+# Trace length
+spiral_shape = 'square'  # Shape of the spiral used for the trace length, one of SPIRAL_SHAPES
+# Perimeter of one turn divided by its outer diameter, for the hexagon the diameter is across the flats
+SPIRAL_SHAPES = {
+    'square': 4,
+    'circular': math.pi,
+    'hexagonal': 2 * math.sqrt(3),
+}
+
 """ Functions """
 def calculate_inner_diameter(tw_csv, ts_csv, tpl_csv, od_csv):
     tw_m = tw_csv/(1000*1000)  #Convert trace width to m
@@ -84,8 +115,8 @@ def calculate_coil_fill_ratio(od_csv, id_csv):
     cfr_um = cfr_mm*1000                                    #Convert mm to um
     return cfr_um
 
-# Function to create the CSV file
-def create_coils(max_outer_diameter, csv_filename):
+# Function to create the coil grid
+def coil_grid(max_outer_diameter):
     coil_numbers = []
     out_diameters = []
     trace_widths = []
@@ -94,9 +125,9 @@ def create_coils(max_outer_diameter, csv_filename):
     capacitance_tanks = []
     cn = 1 # Initialize coil_number
     # Generate rows for each combination of parameters
-    for tw1 in range(150, 1010, 10):                        # 0.15mm to 1mm in steps of 0.01mm
-        for ts1 in range(150, 301, 10):                     # 0.15mm to 0.3mm in steps of 0.01mm
-            for tpl2 in range(1, 121):                      # 1 to 120
+    for tw1 in trace_width_range:                           # 0.15mm to 1mm in steps of 0.01mm
+        for ts1 in trace_spacing_range:                     # 0.15mm to 0.3mm in steps of 0.01mm
+            for tpl2 in turns_range:                        # 1 to 120
                 for cap_value in capacitance_tank:
                     coil_numbers.append(cn)
                     out_diameters.append(max_outer_diameter)
@@ -112,44 +143,42 @@ def create_coils(max_outer_diameter, csv_filename):
         'CSV_TraceSpacing': trace_spacings,
         'CSV_TurnsPerLayer': turns_per_layers,
         'CSV_TankCap': capacitance_tanks})
+    return df
+
+# Function to create the CSV file
+def create_coils(max_outer_diameter, csv_filename):
+    df = coil_grid(max_outer_diameter)
     # Write DataFrame to CSV
     df.to_csv(csv_filename, index=False)
 
 
-def inner_diameter_csv(input_csv, output_csv):
-    df = pd.read_csv(input_csv)                                         # Read the existing CSV file
-    if 'CSV_InnerDiameter' not in df.columns:                           # Check if 'CSV_InnerDiameter' column already exists
-        df['CSV_InnerDiameter'] = calculate_inner_diameter(df['CSV_TraceWidth'], df['CSV_TraceSpacing'], df['CSV_TurnsPerLayer'], df['CSV_OutterDiameter'])# Calculate and add CSV_InnerDiameter to the DataFrame
-    else: 
-        df['CSV_InnerDiameter'] = calculate_inner_diameter(df['CSV_TraceWidth'], df['CSV_TraceSpacing'], df['CSV_TurnsPerLayer'], df['CSV_OutterDiameter'])        # Overwrite the existing 'CSV_InnerDiameter' column
+def inner_diameter_stage(df, params):
+    df['CSV_InnerDiameter'] = calculate_inner_diameter(df['CSV_TraceWidth'], df['CSV_TraceSpacing'], df['CSV_TurnsPerLayer'], df['CSV_OutterDiameter'])
     df['CSV_InnerDiameter'] = df['CSV_InnerDiameter'].astype(int)       # Convert 'CSV_InnerDiameter' to integers
-    df.to_csv(output_csv, index=False)                                  # Write the updated DataFrame to the new CSV file
-    updated_df = pd.read_csv(output_csv)                                # Read the CSV file again
-    updated_df = updated_df[updated_df['CSV_InnerDiameter'] >= 0]       # Remove rows with inner diameter less than 0
-    updated_df.to_csv(output_csv, index=False)                          # Write the updated DataFrame to the same CSV file
+    df = df[df['CSV_InnerDiameter'] >= 0]                               # Remove rows with inner diameter less than 0
+    return df.reset_index(drop=True)
 
+def inner_diameter_csv(input_csv, output_csv):
+    _csv_stage(inner_diameter_stage, input_csv, output_csv)
 
-def avg_diameter_csv(input_csv, output_csv):
-    df = pd.read_csv(input_csv)                                         # Read the existing CSV file
-    if 'CSV_AvgDiameter' not in df.columns:                             # Check if 'CSV_AvgDiameter' column already exists
-        df['CSV_AvgDiameter'] = calculate_avg_diameter(df['CSV_InnerDiameter'], df['CSV_OutterDiameter'])# Calculate and add CSV_AvgDiameter to the DataFrame
-    else:
-        df['CSV_AvgDiameter'] = calculate_avg_diameter(df['CSV_InnerDiameter'], df['CSV_OutterDiameter'])# Overwrite the existing 'CSV_AvgDiameter' column
+
+def avg_diameter_stage(df, params):
+    df['CSV_AvgDiameter'] = calculate_avg_diameter(df['CSV_InnerDiameter'], df['CSV_OutterDiameter'])
     df['CSV_AvgDiameter'] = df['CSV_AvgDiameter'].astype(int)           # Convert 'CSV_AvgDiameter' to integers
-    df.to_csv(output_csv, index=False)                                  # Write the updated DataFrame to the new CSV file
+    return df
 
+def avg_diameter_csv(input_csv, output_csv):
+    _csv_stage(avg_diameter_stage, input_csv, output_csv)
 
-def coil_fill_ratio_csv(input_csv, output_csv):
-    df = pd.read_csv(input_csv)                                         # Read the existing CSV file
-    if 'CSV_OutterDiameter' not in df.columns:                          # Check if 'CSV_AvgDiameter' and 'CSV_InnerDiameter' columns already exist
-        create_coils(max_outer_diameter, csv_filename)                  # Make sure outer diameter is available
-    if 'CSV_InnerDiameter' not in df.columns:
-        inner_diameter_csv(input_csv, input_csv)                        # Make sure CSV_InnerDiameter is available
+
+def coil_fill_ratio_stage(df, params):
     df['CSV_CFR'] = calculate_coil_fill_ratio(df['CSV_OutterDiameter'], df['CSV_InnerDiameter'])# Calculate coil fill ratio
-    df['CSV_CFR'] = df['CSV_CFR'].astype(int)                                     # Convert 'coil_fill_ratio' to integers
-    df.to_csv(output_csv, index=False)                                  # Write the updated DataFrame to the new CSV file
-    df = df[df['CSV_CFR'] >= min_coil_fill_ratio]                            # Remove rows with coil fill ratio below the threshold
-    df.to_csv(output_csv, index=False)                                  # Write the updated DataFrame to the new CSV file
+    df['CSV_CFR'] = df['CSV_CFR'].astype(int)                           # Convert 'coil_fill_ratio' to integers
+    df = df[df['CSV_CFR'] >= params['min_coil_fill_ratio']]             # Remove rows with coil fill ratio below the threshold
+    return df.reset_index(drop=True)
+
+def coil_fill_ratio_csv(input_csv, output_csv):
+    _csv_stage(coil_fill_ratio_stage, input_csv, output_csv)
 
     
 def calculate_total_inductance(turns_per_layer, avg_diameter, coil_fill_ratio):
@@ -157,10 +186,7 @@ def calculate_total_inductance(turns_per_layer, avg_diameter, coil_fill_ratio):
     # Geometry of coil
     k1=2.34
     k2=2.75
-    C1 = 1.27  # Adjust the value of C1 based on your specific units and requirements
-    C2 = 2.07  # Adjust the value of C2 based on your specific units and requirements
-    C3 = 0.18  # Adjust the value of C3 based on your specific units and requirements
-    C4 = 0.13  # Adjust the value of C4 based on your specific units and requirements
+    # C1 to C4 are the module level fit constants, adjust them there
     
     ad_m = avg_diameter / (1000 * 1000)  # Convert 'avg_diameter' to meters
     cfr_m = coil_fill_ratio / (1000 * 1000)  # Convert 'coil_fill_ratio' to meters
@@ -171,34 +197,54 @@ def calculate_total_inductance(turns_per_layer, avg_diameter, coil_fill_ratio):
     L_pH = L_H * 1e12
     return L_pH
 
-def inductance_csv(input_csv, output_csv):
-    # Read the existing CSV file
-    df = pd.read_csv(input_csv)
-    # Apply the calculate_total_inductance function to each row
-    df['CSV_CoilInductance'] = df.apply(lambda row: calculate_total_inductance(row['CSV_TurnsPerLayer'], row['CSV_AvgDiameter'], row['CSV_CFR']), axis=1)
+def calculate_total_inductance_array(turns_per_layer, avg_diameter, coil_fill_ratio, C1=C1, C2=C2, C3=C3, C4=C4):
+    """Array version of calculate_total_inductance, takes whole columns and returns an array in pH."""
+    mu_0 = 4 * math.pi * 1e-7  # Permeability of free space
+    turns_per_layer = np.asarray(turns_per_layer, dtype=float)
+    ad_m = np.asarray(avg_diameter, dtype=float) / (1000 * 1000)  # Convert 'avg_diameter' to meters
+    cfr_m = np.asarray(coil_fill_ratio, dtype=float) / (1000 * 1000)  # Convert 'coil_fill_ratio' to meters
+    L_H = ((mu_0*(turns_per_layer**2)*ad_m*C1) / 2) * (np.log(C2/cfr_m)+(C3*cfr_m)+(C4*cfr_m**2))
+    L_H = L_H * 4
+    L_pH = L_H * 1e12
+    return L_pH
+
+def inductance_stage(df, params):
+    df['CSV_CoilInductance'] = calculate_total_inductance_array(df['CSV_TurnsPerLayer'], df['CSV_AvgDiameter'], df['CSV_CFR'], **params['inductance_fit'])
     df['CSV_CoilInductance'] = df['CSV_CoilInductance'].astype(int)                                     # Convert 'coil_fill_ratio' to integers
-    # Write the updated DataFrame to the new CSV file
-    df.to_csv(output_csv, index=False)
+    return df
+
+def inductance_csv(input_csv, output_csv):
+    _csv_stage(inductance_stage, input_csv, output_csv)
 
 def calculate_sensor_frequency(coil_inductance, tank_cap):
     f_sens_Hz = 1 / (2 * math.pi * math.sqrt(float(coil_inductance) * float(tank_cap)))
     f_sens_pHz = f_sens_Hz * 1e12 #convert to picoHz
     return f_sens_pHz
 
-def sensor_freq_csv(input_csv, output_csv):
-    df = pd.read_csv(input_csv)
-    df['CSV_SensorFreq'] = df.apply(lambda row: calculate_sensor_frequency(row['CSV_CoilInductance'], row['CSV_TankCap']), axis=1)
+def calculate_sensor_frequency_array(coil_inductance, tank_cap):
+    """Array version of calculate_sensor_frequency."""
+    coil_inductance = np.asarray(coil_inductance, dtype=float)
+    tank_cap = np.asarray(tank_cap, dtype=float)
+    f_sens_Hz = 1 / (2 * math.pi * np.sqrt(coil_inductance * tank_cap))
+    f_sens_pHz = f_sens_Hz * 1e12 #convert to picoHz
+    return f_sens_pHz
+
+def sensor_freq_stage(df, params):
+    df['CSV_SensorFreq'] = calculate_sensor_frequency_array(df['CSV_CoilInductance'], df['CSV_TankCap'])
     df['CSV_SensorFreq'] = df['CSV_SensorFreq'].astype(int)                                     # Convert 'coil_fill_ratio' to integers
-    df.to_csv(output_csv, index=False)
+    return df
+
+def sensor_freq_csv(input_csv, output_csv):
+    _csv_stage(sensor_freq_stage, input_csv, output_csv)
 
 
-def calculate_R_s(sens_freq, traced_width ):
+def calculate_R_s(sens_freq, traced_width, copper_thickness=copper_thickness):
     """Calculate the impedance of a winding with a given number of turns and diameter.
     https://www.infineon.com/dgdl/Infineon-AN219207_Inductive_Sensing_Design_Guide-ApplicationNotes-v04_00-EN.pdf?fileId=8ac78c8c7cdc391c017d0d358bd5662c
     Equation 20"""
     frequency = sens_freq/1e12 #convert to Hz
     trace_width = traced_width/1000 #convert to mm
-    trace_height = 34.79/1e3  # Trace height in mm
+    trace_height = copper_thickness/1e3  # Trace height in mm
     relative_resistivity = 1 # 1.526 #constant
     f_rho_R = 2.16e-7  # Constant factor
     #series_resistance = ((f_rho_R)*math.sqrt(frequency*relative_resistivity))/(2*(trace_width+trace_height))
@@ -207,14 +253,25 @@ def calculate_R_s(sens_freq, traced_width ):
     Rs_zOhms = Rs*1e21 #convert to ztta ohms
     return Rs_zOhms
 
-def calculate_R_s_csv(input_csv, output_csv):
-    # Read the CSV file
-    df = pd.read_csv(input_csv)
+def calculate_R_s_array(sens_freq, traced_width, copper_thickness=copper_thickness):
+    """Array version of calculate_R_s."""
+    frequency = np.asarray(sens_freq, dtype=float)/1e12 #convert to Hz
+    trace_width = np.asarray(traced_width, dtype=float)/1000 #convert to mm
+    trace_height = copper_thickness/1e3  # Trace height in mm
+    relative_resistivity = 1
+    f_rho_R = 2.16e-7  # Constant factor
+    Rs = (f_rho_R * np.sqrt(frequency * relative_resistivity)) / (2 * (trace_width + trace_height))
+    Rs_zOhms = Rs*1e21 #convert to ztta ohms
+    return Rs_zOhms
+
+def calculate_R_s_stage(df, params):
     # Calculate Rs for each row and create a new column 'CSV_SeriesACResistance'
-    df['CSV_SeriesACResistance'] = df.apply(lambda row: calculate_R_s(row['CSV_TraceWidth'], row['CSV_SensorFreq']), axis=1)
-    # Save the results to the output CSV file
+    df['CSV_SeriesACResistance'] = calculate_R_s_array(df['CSV_SensorFreq'], df['CSV_TraceWidth'], params['copper_thickness'])
     df['CSV_SeriesACResistance'] = df['CSV_SeriesACResistance'].astype(int)                                     # Convert 'coil_fill_ratio' to integers
-    df.to_csv(output_csv, index=False)
+    return df
+
+def calculate_R_s_csv(input_csv, output_csv):
+    _csv_stage(calculate_R_s_stage, input_csv, output_csv)
 
 def calculate_trace_length(outer_diameter, num_turns, trace_width, trace_spacing):
     wire_length = 0
@@ -224,19 +281,33 @@ def calculate_trace_length(outer_diameter, num_turns, trace_width, trace_spacing
         side_length -= 2 * (trace_width + trace_spacing)
     return wire_length
 
-def trace_length_csv(input_csv, output_csv):
-    df = pd.read_csv(input_csv)
+def calculate_trace_length_array(outer_diameter, num_turns, trace_width, trace_spacing, shape='square'):
+    """Batched trace length for whole columns.
+
+    Every turn is 2*(trace_width + trace_spacing) narrower than the one before it, so the
+    turn diameters are an arithmetic series and the length is its sum times the perimeter
+    factor of the spiral shape. 'square' gives the same result as calculate_trace_length.
+    """
+    if shape not in SPIRAL_SHAPES:
+        raise ValueError(f"Unknown spiral shape '{shape}', expected one of: {', '.join(SPIRAL_SHAPES)}")
+    num_turns = np.floor(np.asarray(num_turns, dtype=float))
+    pitch = np.asarray(trace_width, dtype=float) + np.asarray(trace_spacing, dtype=float)
+    diameter_sum = num_turns * np.asarray(outer_diameter, dtype=float) - pitch * num_turns * (num_turns - 1)
+    return SPIRAL_SHAPES[shape] * diameter_sum
+
+def trace_length_stage(df, params):
     # Calculate wire length using the effective side length and number of turns
-    df['CSV_TraceLength'] = df.apply(lambda row: calculate_trace_length(row['CSV_OutterDiameter'], row['CSV_TurnsPerLayer'], row['CSV_TraceWidth'], row['CSV_TraceSpacing']), axis=1)
-    # Convert to appropriate units if needed
-    # Save the updated DataFrame to the output CSV
+    df['CSV_TraceLength'] = calculate_trace_length_array(df['CSV_OutterDiameter'], df['CSV_TurnsPerLayer'], df['CSV_TraceWidth'], df['CSV_TraceSpacing'], params['spiral_shape'])
     df['CSV_TraceLength'] = df['CSV_TraceLength'].astype(int)                                     # Convert 'coil_fill_ratio' to integers
-    df.to_csv(output_csv, index=False)
+    return df
+
+def trace_length_csv(input_csv, output_csv):
+    _csv_stage(trace_length_stage, input_csv, output_csv)
 
-def calculate_dc_resistance(wire_length, trace_width):
+def calculate_dc_resistance(wire_length, trace_width, copper_thickness=copper_thickness):
     # Convert trace dimensions to meters
     trace_width_m = trace_width / 1000*1000  # converting um to m
-    trace_height = 34.79/1e3/1000  # Trace height in m
+    trace_height = copper_thickness/1e3/1000  # Trace height in m
     resistivity_copper = 1.68e-7  # in Ohm * m^2 / square
     # Calculate cross-sectional area
     cross_sectional_area = trace_width_m * trace_height
@@ -244,13 +315,23 @@ def calculate_dc_resistance(wire_length, trace_width):
     resistance = resistivity_copper * (wire_length / cross_sectional_area)
     return resistance*1e3
 
-def calculate_dc_resistance_csv(input_csv, output_csv):
-    df = pd.read_csv(input_csv)
+def calculate_dc_resistance_array(wire_length, trace_width, copper_thickness=copper_thickness):
+    """Array version of calculate_dc_resistance."""
+    trace_width_m = np.asarray(trace_width, dtype=float) / 1000*1000  # converting um to m
+    trace_height = copper_thickness/1e3/1000  # Trace height in m
+    resistivity_copper = 1.68e-7  # in Ohm * m^2 / square
+    cross_sectional_area = trace_width_m * trace_height
+    resistance = resistivity_copper * (np.asarray(wire_length, dtype=float) / cross_sectional_area)
+    return resistance*1e3
+
+def calculate_dc_resistance_stage(df, params):
     # Calculate DC resistance
-    df['CSV_DCResistance'] = df.apply(lambda row: calculate_dc_resistance(row['CSV_TraceLength'], row['CSV_TraceWidth']), axis=1)
-    # Save the updated DataFrame to the output CSV
+    df['CSV_DCResistance'] = calculate_dc_resistance_array(df['CSV_TraceLength'], df['CSV_TraceWidth'], params['copper_thickness'])
     df['CSV_DCResistance'] = df['CSV_DCResistance'].astype(int)                                     # Convert 'coil_fill_ratio' to integers
-    df.to_csv(output_csv, index=False)
+    return df
+
+def calculate_dc_resistance_csv(input_csv, output_csv):
+    _csv_stage(calculate_dc_resistance_stage, input_csv, output_csv)
 
 #Using DC resistance in the wrong way 
 def calculate_q_factor(s_f, i_v, s_r):
@@ -258,50 +339,510 @@ def calculate_q_factor(s_f, i_v, s_r):
     inductnace_val = i_v * 1e3
     series_resistance = s_r/1e3
     q_factor = (2*(math.pi)*sense_freq * inductnace_val)/series_resistance
+    return q_factor
+
+def calculate_q_factor_array(s_f, i_v, s_r):
+    """Array version of calculate_q_factor."""
+    sense_freq = np.asarray(s_f, dtype=float) * 1e3
+    inductnace_val = np.asarray(i_v, dtype=float) * 1e3
+    series_resistance = np.asarray(s_r, dtype=float)/1e3
+    q_factor = (2*(math.pi)*sense_freq * inductnace_val)/series_resistance
+    return q_factor
 
 def calculate_q_factor_chatgpt(series_impedance, ac_resistance):
     reactance = series_impedance - ac_resistance
     q_factor = reactance / ac_resistance
     return q_factor
 
+def calculate_q_factor_stage(df, params):
+    df['CSV_Qfactor'] = calculate_q_factor_array(df['CSV_SensorFreq'], df['CSV_CoilInductance'], df['CSV_DCResistance'])
+    # Q is left as a float, the scaled values overflow int64
+    return df
+
 def calculate_q_factor_csv(input_csv, output_csv):
+    _csv_stage(calculate_q_factor_stage, input_csv, output_csv)
+
+
+""" Pipeline """
+# A stage adds `column` to the table, it needs the `inputs` columns to be there already and
+# only reads the `params` settings named. The result cache relies on these being complete.
+Stage = namedtuple('Stage', ['name', 'column', 'inputs', 'params', 'func'])
+
+PIPELINE_STAGES = [
+    Stage('inner_diameter', 'CSV_InnerDiameter', ('CSV_TraceWidth', 'CSV_TraceSpacing', 'CSV_TurnsPerLayer', 'CSV_OutterDiameter'), (), inner_diameter_stage),
+    Stage('avg_diameter', 'CSV_AvgDiameter', ('CSV_InnerDiameter', 'CSV_OutterDiameter'), (), avg_diameter_stage),
+    Stage('coil_fill_ratio', 'CSV_CFR', ('CSV_OutterDiameter', 'CSV_InnerDiameter'), ('min_coil_fill_ratio',), coil_fill_ratio_stage),
+    Stage('inductance', 'CSV_CoilInductance', ('CSV_TurnsPerLayer', 'CSV_AvgDiameter', 'CSV_CFR'), ('inductance_fit',), inductance_stage),
+    Stage('sensor_freq', 'CSV_SensorFreq', ('CSV_CoilInductance', 'CSV_TankCap'), (), sensor_freq_stage),
+    Stage('R_s', 'CSV_SeriesACResistance', ('CSV_SensorFreq', 'CSV_TraceWidth'), ('copper_thickness',), calculate_R_s_stage),
+    Stage('trace_length', 'CSV_TraceLength', ('CSV_OutterDiameter', 'CSV_TurnsPerLayer', 'CSV_TraceWidth', 'CSV_TraceSpacing'), ('spiral_shape',), trace_length_stage),
+    Stage('dc_resistance', 'CSV_DCResistance', ('CSV_TraceLength', 'CSV_TraceWidth'), ('copper_thickness',), calculate_dc_resistance_stage),
+    Stage('q_factor', 'CSV_Qfactor', ('CSV_SensorFreq', 'CSV_CoilInductance', 'CSV_DCResistance'), (), calculate_q_factor_stage),
+]
+
+def sweep_params(**overrides):
+    """Settings shared by the pipeline stages, keyword arguments override the defaults."""
+    params = {
+        'outer_diameter': input_outter_diameter*1000,       # um
+        'capacitance_tank': capacitance_tank,               # pF
+        'trace_widths': trace_width_range,                  # um
+        'trace_spacings': trace_spacing_range,              # um
+        'turns': turns_range,
+        'min_coil_fill_ratio': min_coil_fill_ratio,
+        'spiral_shape': spiral_shape,
+        'copper_thickness': copper_thickness,               # um
+        'inductance_fit': {'C1': C1, 'C2': C2, 'C3': C3, 'C4': C4},
+    }
+    params.update(overrides)
+    return params
+
+def get_stage(name, stages=PIPELINE_STAGES):
+    for stage in stages:
+        if stage.name == name:
+            return stage
+    raise KeyError(f"Unknown pipeline stage '{name}'")
+
+def run_pipeline(df, stages=PIPELINE_STAGES, params=None, output=None, persist=None, stats=None, cache=None, keys=None):
+    """Run the stages in order on one in-memory table.
+
+    persist maps a stage name to a file the table is saved to straight after that stage,
+    output is written once at the end. Files ending in .csv are written as csv, anything
+    else as a Coil_Result_Store store. If stats is a dict the rows going in, out and pruned
+    and the wall time (seconds) of every stage are added to stats[stage.name], and while
+    tracemalloc is tracing the peak memory traced during the stage (peak_bytes) too.
+    Returns the final DataFrame.
+
+    With a Coil_Result_Cache.ResultCache, stages whose key is already cached are not run.
+    keys holds the cache keys of the table's columns and rows, columns without one are
+    keyed by their contents, and it is updated as the stages run.
+    """
+    if params is None:
+        params = sweep_params()
+    persist = persist or {}
+    unknown = set(persist) - {stage.name for stage in stages}
+    if unknown:
+        raise KeyError(f"Cannot persist unknown stage(s): {', '.join(sorted(unknown))}")
+    # The stages assign whole columns, a shallow copy keeps them out of the caller's DataFrame
+    df = df.copy(deep=False)
+    for stage in stages:
+        missing = [column for column in stage.inputs if column not in df.columns]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' is missing input column(s): {', '.join(missing)}")
+        rows_in = len(df)
+        cache_hit = False
+        tracing = stats is not None and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        if cache is None:
+            df = stage.func(df, params)
+        else:
+            keys = key_table(df, {} if keys is None else keys)
+            key = stage_key(stage, params, keys)
+            df, cache_hit = _cached_stage(df, stage, params, cache, key)
+            keys[stage.column] = key
+            if len(df) != rows_in:
+                keys[ROWS_KEY] = key
+        if stats is not None:
+            seconds = time.perf_counter() - start
+            stage_stats = stats.setdefault(stage.name, {'rows_in': 0, 'rows_out': 0, 'rows_pruned': 0, 'cache_hits': 0, 'seconds': 0.0})
+            stage_stats['rows_in'] += rows_in
+            stage_stats['rows_out'] += len(df)
+            stage_stats['rows_pruned'] += rows_in - len(df)
+            stage_stats['cache_hits'] += cache_hit
+            stage_stats['seconds'] += seconds
+            if tracing:
+                stage_stats['peak_bytes'] = max(stage_stats.get('peak_bytes', 0), tracemalloc.get_traced_memory()[1])
+        if stage.name in persist:
+            save_table(df, persist[stage.name], params)
+    if output is not None:
+        save_table(df, output, params)
+    return df
+
+def _cached_stage(df, stage, params, cache, key):
+    # Use the cached column (and kept rows) for key, or run the stage and cache what it made
+    cached = cache.get(key)
+    if cached is not None:
+        values, rows = cached
+        if rows is not None:
+            df = df.iloc[rows].reset_index(drop=True)
+        df[stage.column] = values
+        return df, True
+    rows_in = len(df)
+    df['_cache_row'] = np.arange(rows_in)
+    df = stage.func(df, params)
+    rows = df.pop('_cache_row').to_numpy()
+    cache.put(key, df[stage.column].to_numpy(), rows if len(rows) != rows_in else None)
+    return df, False
+
+def split_stages(stages=PIPELINE_STAGES):
+    """Split stages into the ones that only need the coil geometry and the ones that need CSV_TankCap."""
+    tank_columns = {'CSV_TankCap'}
+    geometry_stages = []
+    tank_stages = []
+    for stage in stages:
+        if tank_columns.intersection(stage.inputs):
+            tank_columns.add(stage.column)
+            tank_stages.append(stage)
+        else:
+            geometry_stages.append(stage)
+    return geometry_stages, tank_stages
+
+def sweep_axes(params):
+    """The trace width, trace spacing and (sorted) turn axes of the sweep grid as arrays."""
+    return np.asarray(params['trace_widths']), np.asarray(params['trace_spacings']), np.sort(np.asarray(params['turns']))
+
+def candidate_counts(params, pairs):
+    """Number of candidate turns of each width/spacing pair (flat index width * spacings + spacing).
+
+    The turns stop one past od/(2*pitch), every turn after that has a negative inner diameter.
+    The turn that is kept on top is left to inner_diameter_stage so it makes the exact call.
+    """
+    widths, spacings, turns = sweep_axes(params)
+    tw_idx, ts_idx = np.divmod(pairs, len(spacings))
+    pitch = widths[tw_idx] + spacings[ts_idx]
+    return np.searchsorted(turns, params['outer_diameter'] // (2 * pitch) + 1, side='right')
+
+def _geometry_candidates(params, pairs=None):
+    # Enumerate (trace width, trace spacing, turns) for the given pairs without the tank capacitors
+    widths, spacings, _ = sweep_axes(params)
+    if pairs is None:
+        pairs = np.arange(len(widths) * len(spacings))
+    counts = candidate_counts(params, pairs)
+    starts = np.cumsum(counts) - counts
+    pair_rows = np.repeat(np.arange(len(pairs)), counts)
+    turn_idx = np.arange(counts.sum()) - starts[pair_rows]
+    tw_idx, ts_idx = np.divmod(pairs[pair_rows], len(spacings))
+    return _geometry_rows(params, tw_idx, ts_idx, turn_idx)
+
+def _geometry_rows(params, tw_idx, ts_idx, turn_idx):
+    # Candidate rows for points of the grid given as indices into the width, spacing and turn axes
+    widths, spacings, turns = sweep_axes(params)
+    num_caps = len(params['capacitance_tank'])
+    # Same numbering as coil_grid, the number of the coil using the first tank capacitor
+    coil_numbers = ((tw_idx * len(spacings) + ts_idx) * len(turns) + turn_idx) * num_caps + 1
+    return pd.DataFrame({
+        'CSV_CoilNumber': coil_numbers,
+        'CSV_OutterDiameter': np.full(len(coil_numbers), params['outer_diameter']),
+        'CSV_TraceWidth': widths[tw_idx],
+        'CSV_TraceSpacing': spacings[ts_idx],
+        'CSV_TurnsPerLayer': turns[turn_idx]})
+
+def feasible_geometries(params=None, stages=PIPELINE_STAGES, persist=None, pairs=None, stats=None, cache=None, keys=None):
+    """One row per feasible coil geometry with every column that does not depend on the tank capacitor."""
+    if params is None:
+        params = sweep_params()
+    geometry_stages, _ = split_stages(stages)
+    if cache is not None:
+        # The candidate rows only depend on these, the coil numbers also depend on the number of capacitors
+        keys = {} if keys is None else keys
+        keys.setdefault(ROWS_KEY, hash_values('geometry', *(params[name] for name in ('outer_diameter', 'trace_widths', 'trace_spacings', 'turns')), pairs))
+    return run_pipeline(_geometry_candidates(params, pairs), stages=geometry_stages, params=params, persist=persist, stats=stats, cache=cache, keys=keys)
+
+def broadcast_tank_caps(geometry, tank_caps):
+    """Repeat every geometry row once per tank capacitor, coil numbers follow coil_grid."""
+    tank_caps = np.asarray(tank_caps)
+    df = geometry.loc[geometry.index.repeat(len(tank_caps))].reset_index(drop=True)
+    cap_idx = np.tile(np.arange(len(tank_caps)), len(geometry))
+    df['CSV_CoilNumber'] = df['CSV_CoilNumber'].to_numpy() + cap_idx
+    df.insert(df.columns.get_loc('CSV_TurnsPerLayer') + 1, 'CSV_TankCap', tank_caps[cap_idx])
+    return df
+
+def sweep_columns(df, stages):
+    """df with its columns in the order coil_grid and the stages give them."""
+    stage_columns = [stage.column for stage in stages if stage.column in df.columns]
+    base_columns = [column for column in df.columns if column not in stage_columns]
+    return df[base_columns + stage_columns]
+
+def _sweep_pairs(params, stages, pairs=None, persist=None, stats=None, cache=None):
+    # Geometry stages once per geometry, tank stages on the rows broadcast over the capacitors
+    persist = persist or {}
+    geometry_stages, tank_stages = split_stages(stages)
+    unknown = set(persist) - {stage.name for stage in stages}
+    if unknown:
+        raise KeyError(f"Cannot persist unknown stage(s): {', '.join(sorted(unknown))}")
+    geometry_names = {stage.name for stage in geometry_stages}
+    keys = {}
+    geometry = feasible_geometries(params, stages, {name: path for name, path in persist.items() if name in geometry_names}, pairs, stats, cache, keys)
+    df = broadcast_tank_caps(geometry, params['capacitance_tank'])
+    if cache is not None:
+        # Geometry columns keep their keys, only the rows and the new columns change
+        keys[ROWS_KEY] = hash_values('tank_caps', keys[ROWS_KEY], params['capacitance_tank'])
+        keys.pop('CSV_CoilNumber', None)
+        keys.pop('CSV_TankCap', None)
+    df = run_pipeline(df, stages=tank_stages, params=params, persist={name: path for name, path in persist.items() if name not in geometry_names}, stats=stats, cache=cache, keys=keys)
+    return sweep_columns(df, stages)
+
+def sweep_points(params, tw_idx, ts_idx, turn_idx, stages=PIPELINE_STAGES, stats=None):
+    """Sweep rows for single grid points, given as indices into the width, spacing and turn axes,
+    with every tank capacitor. Rows and coil numbers are the ones run_sweep gives for those points."""
+    geometry_stages, tank_stages = split_stages(stages)
+    geometry = run_pipeline(_geometry_rows(params, *(np.asarray(idx, dtype=np.int64) for idx in (tw_idx, ts_idx, turn_idx))), stages=geometry_stages, params=params, stats=stats)
+    df = run_pipeline(broadcast_tank_caps(geometry, params['capacitance_tank']), stages=tank_stages, params=params, stats=stats)
+    return sweep_columns(df, stages)
+
+def run_sweep(max_outer_diameter=None, output=None, persist=None, params=None, stages=PIPELINE_STAGES, cache=None, stats=None):
+    """Run every stage for the coils that fit in max_outer_diameter (um).
+
+    The geometry stages run once per feasible geometry, only the tank capacitor
+    stages run on the rows broadcast over params['capacitance_tank']. With a cache,
+    stages whose inputs have not changed since an earlier run are read back instead.
+    """
+    if params is None:
+        # No diameter keeps the sweep_params default
+        params = sweep_params() if max_outer_diameter is None else sweep_params(outer_diameter=max_outer_diameter)
+    df = _sweep_pairs(params, stages, persist=persist, stats=stats, cache=cache)
+    if output is not None:
+        save_table(df, output, params)
+    return df
+
+def _pair_chunks(params, chunk_rows, block_pairs=4096):
+    # Group width/spacing pairs so each group gives at most chunk_rows candidate rows once it is
+    # broadcast over the tank capacitors. The pairs are walked block by block so nothing here
+    # grows with the size of the grid.
+    widths, spacings, _ = sweep_axes(params)
+    num_pairs = len(widths) * len(spacings)
+    num_caps = len(params['capacitance_tank'])
+    pending = []
+    pending_rows = 0
+    for block_start in range(0, num_pairs, block_pairs):
+        pairs = np.arange(block_start, min(block_start + block_pairs, num_pairs))
+        cum_rows = np.cumsum(candidate_counts(params, pairs) * num_caps)
+        i = 0
+        while i < len(pairs):
+            done_rows = cum_rows[i - 1] if i else 0
+            j = int(np.searchsorted(cum_rows, done_rows + chunk_rows - pending_rows, side='right'))
+            if j == i:
+                if pending:
+                    yield np.concatenate(pending)
+                    pending = []
+                    pending_rows = 0
+                    continue
+                j = i + 1  # A single pair bigger than chunk_rows goes on its own
+            pending.append(pairs[i:j])
+            pending_rows += cum_rows[j - 1] - done_rows
+            i = j
+    if pending:
+        yield np.concatenate(pending)
+
+def iter_sweep_chunks(params=None, chunk_rows=None, stages=PIPELINE_STAGES, stats=None, cache=None):
+    """Yield the sweep as DataFrames of about chunk_rows rows with every stage already run."""
+    if params is None:
+        params = sweep_params()
+    if chunk_rows is None:
+        chunk_rows = stream_chunk_rows
+    for pairs in _pair_chunks(params, chunk_rows):
+        yield _sweep_pairs(params, stages, pairs, stats=stats, cache=cache)
+
+def stream_sweep(params=None, output=None, chunk_rows=None, top_n=5, top_by=None, on_chunk=None, stages=PIPELINE_STAGES, pareto=False, cache=None):
+    """Run the sweep chunk by chunk so peak memory stays bounded by chunk_rows.
+
+    Every chunk is appended to output (a csv file or a store) and passed to on_chunk. The running top_n rows
+    by top_by (largest first, TOP_OPTIONS_BY by default) and the number of rows going in and out of
+    every stage are kept as it goes, with geometry stage counts given in sweep rows (geometries x capacitors).
+    With pareto=True the running Pareto frontier (see Coil_Selection.pareto_front) is kept too.
+    Returns a summary dict.
+    """
+    if params is None:
+        params = sweep_params()
+    if top_by is None:
+        top_by = TOP_OPTIONS_BY
+    geometry_stages, _ = split_stages(stages)
+    num_caps = len(params['capacitance_tank'])
+    widths, spacings, turns = sweep_axes(params)
+    stats = {}
+    top = None
+    front = None
+    rows = 0
+    chunks = 0
+    writer = StoreWriter(output, params) if output is not None and not str(output).endswith('.csv') else None
+    for df in iter_sweep_chunks(params, chunk_rows, stages, stats, cache):
+        if writer is not None:
+            writer.append(df)
+        elif output is not None:
+            df.to_csv(output, mode='w' if chunks == 0 else 'a', header=chunks == 0, index=False)
+        if on_chunk is not None:
+            on_chunk(df)
+        if top_n:
+            top = merge_top_k([top, df], list(top_by), top_n)
+        if pareto:
+            front = pareto_front(pd.concat([front, pareto_front(df)]) if front is not None else df)
+        rows += len(df)
+        chunks += 1
+    if writer is not None:
+        writer.close()
+    for stage in geometry_stages:
+        if stage.name in stats:
+            for count in ('rows_in', 'rows_out', 'rows_pruned'):
+                stats[stage.name][count] *= num_caps
+    return {
+        'grid_rows': len(widths) * len(spacings) * len(turns) * num_caps,
+        'candidate_rows': stats[geometry_stages[0].name]['rows_in'] if geometry_stages and stats else rows,
+        'rows': rows,
+        'chunks': chunks,
+        'filter_counts': stats,
+        'top': top,
+        'pareto': front,
+    }
+
+""" Sensitivities """
+# Partial derivatives of the model columns with respect to the global constants, so a ranking can
+# be re-estimated for small changes of them without rerunning the sweep. Names are
+# CSV_d<column>_d<constant>, e.g. CSV_dCoilInductance_dC1, copper thickness is per um.
+SENSITIVITY_CONSTANTS = {'C1': 'C1', 'C2': 'C2', 'C3': 'C3', 'C4': 'C4', 'copper_thickness': 'CopperThickness'}
+SENSITIVITY_COLUMNS = ('CSV_CoilInductance', 'CSV_SensorFreq', 'CSV_SeriesACResistance', 'CSV_DCResistance', 'CSV_Qfactor')
+
+def sensitivity_column(column, constant):
+    return f"CSV_d{column[len('CSV_'):]}_d{SENSITIVITY_CONSTANTS[constant]}"
+
+def relative_sensitivity(df, params, column, constant):
+    """(d column / d constant) / column for every row, from the columns the models use.
+
+    L = A*C1*g with g = ln(C2/c) + C3*c + C4*c^2 and c = CSV_CFR/1e6, f ~ L^-1/2,
+    Rs ~ f^1/2 / (trace width + copper thickness), DCR ~ 1/copper thickness and Q ~ f*L/DCR.
+    """
+    fit = params['inductance_fit']
+    if column == 'CSV_CoilInductance':
+        if constant == 'copper_thickness':
+            return np.zeros(len(df))
+        c = df['CSV_CFR'].to_numpy(dtype=float) / (1000 * 1000)
+        g = np.log(fit['C2'] / c) + fit['C3'] * c + fit['C4'] * c ** 2
+        return {'C1': np.full(len(df), 1 / fit['C1']), 'C2': 1 / (g * fit['C2']), 'C3': c / g, 'C4': c ** 2 / g}[constant]
+    if column == 'CSV_SensorFreq':
+        return -relative_sensitivity(df, params, 'CSV_CoilInductance', constant) / 2
+    if column == 'CSV_SeriesACResistance':
+        if constant == 'copper_thickness':
+            return -1 / (df['CSV_TraceWidth'].to_numpy(dtype=float) + params['copper_thickness'])
+        return relative_sensitivity(df, params, 'CSV_SensorFreq', constant) / 2
+    if column == 'CSV_DCResistance':
+        return np.full(len(df), -1 / params['copper_thickness'] if constant == 'copper_thickness' else 0.0)
+    if column == 'CSV_Qfactor':
+        return (relative_sensitivity(df, params, 'CSV_SensorFreq', constant)
+                + relative_sensitivity(df, params, 'CSV_CoilInductance', constant)
+                - relative_sensitivity(df, params, 'CSV_DCResistance', constant))
+    raise KeyError(f"No sensitivity for column '{column}'")
+
+def _sensitivity_stage(column, constant):
+    name = sensitivity_column(column, constant)
+
+    def stage(df, params):
+        df[name] = df[column].to_numpy(dtype=float) * relative_sensitivity(df, params, column, constant)
+        return df
+    return Stage(f'd{column[len("CSV_"):]}_d{SENSITIVITY_CONSTANTS[constant]}', name, (column, 'CSV_CFR', 'CSV_TraceWidth'), ('inductance_fit', 'copper_thickness'), stage)
+
+# Add these after PIPELINE_STAGES to get the derivative columns, only the ones that are not always 0
+SENSITIVITY_STAGES = [
+    _sensitivity_stage(column, constant)
+    for column in SENSITIVITY_COLUMNS for constant in SENSITIVITY_CONSTANTS
+    if not (constant == 'copper_thickness' and column in ('CSV_CoilInductance', 'CSV_SensorFreq'))
+    and not (constant != 'copper_thickness' and column == 'CSV_DCResistance')
+]
+
+def _constant_value(params, constant):
+    return params['copper_thickness'] if constant == 'copper_thickness' else params['inductance_fit'][constant]
+
+def what_if_estimate(df, changes, params=None, columns=SENSITIVITY_COLUMNS):
+    """First-order estimate of columns with the constants in changes (name: new value) changed.
+
+    Uses the CSV_d*_d* columns where the table has them and computes the derivatives otherwise.
+    """
+    if params is None:
+        params = sweep_params()
+    unknown = set(changes) - set(SENSITIVITY_CONSTANTS)
+    if unknown:
+        raise KeyError(f"No sensitivities for: {', '.join(sorted(unknown))}")
+    estimate = pd.DataFrame(index=df.index)
+    for column in columns:
+        values = df[column].to_numpy(dtype=float)
+        for constant, value in changes.items():
+            delta = value - _constant_value(params, constant)
+            name = sensitivity_column(column, constant)
+            derivative = df[name].to_numpy() if name in df.columns else values * relative_sensitivity(df, params, column, constant)
+            values = values + derivative * delta
+        estimate[column] = values
+    return estimate
+
+def what_if_ranking(df, changes, by=None, k=5, shortlist=None, params=None, stages=PIPELINE_STAGES, filters=None):
+    """Top k of df by `by` (largest first, TOP_OPTIONS_BY by default) with the constants in changes changed.
+
+    params are the ones df was swept with (sweep_params() by default). The rows are ranked on the
+    first-order estimate, then only the best `shortlist` of them (20 * k by default) are recomputed
+    exactly with the changed params and ranked again. filters ({column: (low, high)}, see
+    Coil_Query_Engine) are checked on the recomputed values, the shortlist grows until k rows pass.
+    """
+    if params is None:
+        params = sweep_params()
+    if by is None:
+        by = TOP_OPTIONS_BY
+    estimate = what_if_estimate(df, changes, params, [column for column in by if column in SENSITIVITY_COLUMNS])
+    for column in by:
+        if column not in estimate.columns:
+            estimate[column] = df[column]
+    new_params = dict(params, inductance_fit=dict(params['inductance_fit']))
+    for constant, value in changes.items():
+        if constant == 'copper_thickness':
+            new_params['copper_thickness'] = value
+        else:
+            new_params['inductance_fit'][constant] = value
+    base_columns = [column for column in df.columns if column not in {stage.column for stage in list(stages) + SENSITIVITY_STAGES}]
+    shortlist = 20 * k if shortlist is None else shortlist
+    while True:
+        # In table order, so ties come out of top_k the way they would from a full re-sweep
+        candidates = df.iloc[np.sort(top_k_index(estimate, list(by), shortlist))]
+        exact = sweep_columns(run_pipeline(candidates[base_columns].reset_index(drop=True), stages=stages, params=new_params), stages)
+        if filters:
+            exact = exact.iloc[SweepIndex(exact).query(filters)]
+        if len(exact) >= k or shortlist >= len(df):
+            return top_k(exact, list(by), k)
+        shortlist *= 4
+
+def _csv_stage(stage_func, input_csv, output_csv):
+    # Run a single stage from one csv file to another
     df = pd.read_csv(input_csv)
-    # Calculate DC resistance
-    df['CSV_Qfactor'] = df.apply(lambda row: calculate_q_factor(row['CSV_SensorFreq'], row['CSV_CoilInductance'], row['CSV_DCResistance']), axis=1)
-    # Save the updated DataFrame to the output CSV
-    df['CSV_Qfactor'] = df['CSV_Qfactor'].astype(int)                                     # Convert 'coil_fill_ratio' to integers
+    df = stage_func(df, sweep_params())
     df.to_csv(output_csv, index=False)
 
 
+# Ranking of top_five_options, largest first, the default ranking everywhere a sweep is shortlisted
+TOP_OPTIONS_BY = ('CSV_CoilInductance', 'CSV_Qfactor')
 
+def top_five_options(input_csv, changes=None, params=None):
+    # Read the CSV file or result store, or use the DataFrame straight from run_pipeline
+    df = input_csv if isinstance(input_csv, pd.DataFrame) else load_table(input_csv)
+    if params is None and not isinstance(input_csv, pd.DataFrame):
+        # The sweep params a store was written with, the what-if deltas are taken from them
+        params = store_params(input_csv)
 
-
-
-def top_five_options(input_csv):
-    # Read the CSV file
-    df = pd.read_csv(input_csv)
-
-    # Sort the DataFrame by 'CSV_CoilInductance' and 'CSV_Qfactor' columns in descending order
-    df_sorted = df.sort_values(by=['CSV_CoilInductance', 'CSV_Qfactor'], ascending=[False, False])
+    # Top 5 rows by 'CSV_CoilInductance' and 'CSV_Qfactor' columns in descending order, without sorting the whole table
+    if changes:
+        # e.g. {'copper_thickness': 17.5}, re-ranked from the sensitivities instead of a new sweep
+        df_top = what_if_ranking(df, changes, k=5, params=params)
+    else:
+        df_top = top_k(df, list(TOP_OPTIONS_BY), 5, ascending=[False, False])
 
     # Print the top 5 rows
     print("Top 5 Options with Highest Inductance and Q Factor:")
-    print(df_sorted.head(5))
+    print(df_top)
+
+def pareto_options(input_csv):
+    # Coils no other coil beats on inductance, Q, DC resistance and AC resistance all at once
+    df = input_csv if isinstance(input_csv, pd.DataFrame) else load_table(input_csv)
+    front = pareto_front(df)
+    print(f"{len(front)} coils on the Pareto frontier (high inductance and Q, low DC and AC resistance):")
+    print(front)
+    return front
 
 if __name__ == "__main__":
     max_outer_diameter = input_outter_diameter*1000  # Set your max outer diameter value here
     csv_filename = csv_file_name
-    #create_coils(max_outer_diameter, csv_filename)
-    #inner_diameter_csv(csv_file_name, csv_file_name)
-    #avg_diameter_csv(csv_file_name, csv_file_name)
-    #coil_fill_ratio_csv(csv_file_name,csv_file_name)
-    #inductance_csv(csv_file_name, csv_file_name)
-    #sensor_freq_csv(csv_file_name, csv_file_name)
-    #calculate_R_s_csv(csv_file_name, csv_file_name)
-    #trace_length_csv(csv_file_name, csv_file_name)
-    calculate_dc_resistance_csv(csv_file_name, csv_file_name)
-    calculate_q_factor_csv(csv_file_name, csv_file_name)
-    df = pd.read_csv(csv_filename)
+    # Runs every stage in memory and writes the result store once at the end, use csv_filename
+    # instead for a csv file. Add e.g. persist={'inductance': 'coil_inductance_20mm.csv'} to keep an intermediate stage,
+    # or stages=PIPELINE_STAGES + SENSITIVITY_STAGES for the derivative columns used by what_if_ranking
+    # Per-stage wall time and row counts, see Coil_Benchmark for repeatable runs and JSON reports
+    stats = {}
+    df = run_sweep(max_outer_diameter, output=results_file_name, cache=ResultCache(cache_dir), stats=stats)
     print(df.dtypes)
+    print(pd.DataFrame.from_dict(stats, orient='index'))
     # Call the top_five_options function
-    #top_five_options(csv_file_name)
+    top_five_options(df)
+    pareto_options(df)
@@ -0,0 +1,99 @@
+"""
+Title: Coil_Query_Engine
+
+Range queries over a sweep table, e.g. every coil with CSV_SensorFreq inside the sensor IC's band,
+CSV_CoilInductance above a floor, CSV_DCResistance below a ceiling and CSV_CFR above a threshold.
+
+SweepIndex keeps a sorted index (argsort order plus the sorted values) per queried column, built
+the first time the column is used. Each range is counted with a binary search, the most selective
+one gives the candidate rows and only those are checked against the other ranges, so a query
+costs O(log n) per range plus the size of the smallest range instead of a scan of the table.
+"""
+import numpy as np
+
+from Coil_Selection import top_k_index
+
+
+def coil_constraints(freq_band=None, min_inductance=None, max_dc_resistance=None, min_cfr=None, **ranges):
+    """Constraints dict for SweepIndex.query from the usual limits, extra column=(low, high) ranges are passed through.
+
+    freq_band is (low, high) in the units of CSV_SensorFreq, the other limits are inclusive.
+    """
+    constraints = {}
+    if freq_band is not None:
+        constraints['CSV_SensorFreq'] = tuple(freq_band)
+    if min_inductance is not None:
+        constraints['CSV_CoilInductance'] = (min_inductance, None)
+    if max_dc_resistance is not None:
+        constraints['CSV_DCResistance'] = (None, max_dc_resistance)
+    if min_cfr is not None:
+        constraints['CSV_CFR'] = (min_cfr, None)
+    constraints.update(ranges)
+    return constraints
+
+
+class SweepIndex:
+    """Sorted per-column indexes over a sweep DataFrame for conjunctive range queries."""
+    def __init__(self, df):
+        self.df = df
+        self._indexes = {}
+
+    def index(self, column):
+        """(row order, sorted values) for column, built on first use."""
+        if column not in self._indexes:
+            if column not in self.df.columns:
+                raise KeyError(f"Unknown column '{column}'")
+            values = self.df[column].to_numpy()
+            order = np.argsort(values, kind='stable')
+            self._indexes[column] = (order, values[order])
+        return self._indexes[column]
+
+    def _bounds(self, column, low=None, high=None):
+        # Slice of the sorted index holding low <= value <= high
+        _, sorted_values = self.index(column)
+        start = 0 if low is None else np.searchsorted(sorted_values, low, side='left')
+        stop = len(sorted_values) if high is None else np.searchsorted(sorted_values, high, side='right')
+        return start, max(start, stop)
+
+    def count(self, column, low=None, high=None):
+        start, stop = self._bounds(column, low, high)
+        return stop - start
+
+    def range_positions(self, column, low=None, high=None):
+        """Row positions with low <= column <= high, in index order."""
+        order, _ = self.index(column)
+        start, stop = self._bounds(column, low, high)
+        return order[start:stop]
+
+    def query(self, constraints):
+        """Row positions (ascending) meeting every column: (low, high) range, None leaves a side open."""
+        if not constraints:
+            return np.arange(len(self.df))
+        counts = {column: self.count(column, *bounds) for column, bounds in constraints.items()}
+        narrowest = min(counts, key=counts.get)
+        positions = self.range_positions(narrowest, *constraints[narrowest])
+        for column, (low, high) in constraints.items():
+            if column == narrowest or len(positions) == 0:
+                continue
+            values = self.df[column].to_numpy()[positions]
+            keep = np.ones(len(positions), dtype=bool)
+            if low is not None:
+                keep &= values >= low
+            if high is not None:
+                keep &= values <= high
+            positions = positions[keep]
+        return np.sort(positions)
+
+    def select(self, constraints, sort_by=None, k=None, ascending=False):
+        """Rows meeting constraints, optionally the top k of them by sort_by (see Coil_Selection.top_k)."""
+        df = self.df.iloc[self.query(constraints)]
+        if sort_by:
+            df = df.iloc[top_k_index(df, sort_by, len(df) if k is None else k, ascending)]
+        elif k is not None:
+            df = df.head(k)
+        return df
+
+
+def query(df, constraints, sort_by=None, k=None, ascending=False):
+    """One-off query, keep a SweepIndex around instead when querying the same table again."""
+    return SweepIndex(df).select(constraints, sort_by, k, ascending)
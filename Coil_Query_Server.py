@@ -0,0 +1,214 @@
+"""
+Title: Coil_Query_Server
+
+Keeps one sweep result resident (a store stays memory mapped) and answers filter/sort/top-K and
+Pareto queries over HTTP/JSON on localhost, so the GUI and scripts stop loading the same table
+again and again. The server runs on asyncio, each query runs in a thread pool so slow queries do
+not hold up the others. QueryClient is the matching client, standard library only.
+
+GET  /columns   {"columns": [...], "rows": n, "path": ...}
+POST /query     {"filters": {"CSV_SensorFreq": [low, high], ...}, "sort_by": [...], "ascending": false,
+                 "k": 10, "columns": [...]}
+POST /pareto    {"filters": {...}, "k": 100, "columns": [...]}
+Filter bounds can be null to leave a side open, every field is optional. k defaults to
+DEFAULT_ROWS and can be at most MAX_ROWS. Both POSTs answer
+{"total": rows matching the filters, "table": {"columns": [...], "dtypes": [...], "data": [[...], ...]}}.
+
+python Coil_Query_Server.py coil_parameters_20mm.coils --port 8765
+"""
+import argparse
+import asyncio
+import json
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+from Coil_Query_Engine import SweepIndex
+from Coil_Result_Store import load_table
+from Coil_Selection import pareto_index, top_k_index
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_BODY = 1024 * 1024  # Largest request body accepted, in bytes
+DEFAULT_ROWS = 1000     # Rows answered when the request gives no k
+MAX_ROWS = 100000       # Largest k accepted, bounds the size of a response
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+def _filters(request):
+    # {"column": [low, high]} to the (low, high) tuples SweepIndex.query takes
+    return {column: tuple(bounds) for column, bounds in (request.get('filters') or {}).items()}
+
+def _names(names):
+    # A single column name or a list of them, as a list
+    return [names] if isinstance(names, str) else list(names)
+
+def _rows(request):
+    k = request.get('k')
+    if k is None:
+        return DEFAULT_ROWS
+    if isinstance(k, bool) or not isinstance(k, int) or not 0 <= k <= MAX_ROWS:
+        raise ValueError(f"k must be a whole number from 0 to {MAX_ROWS}")
+    return k
+
+def _table_json(total, df):
+    # tolist gives Python numbers, which json writes exactly, the dtypes let the client restore the columns
+    return json.dumps({'total': int(total), 'table': {
+        'columns': list(df.columns),
+        'dtypes': [str(dtype) for dtype in df.dtypes],
+        'data': list(zip(*(df[column].tolist() for column in df.columns)))}})
+
+
+class SweepService:
+    """The queries the server answers, on one table kept in memory."""
+    def __init__(self, path):
+        self.path = path
+        self.df = load_table(path)
+        self.index = SweepIndex(self.df)
+
+    def columns(self):
+        return json.dumps({'columns': list(self.df.columns), 'rows': len(self.df), 'path': str(self.path)})
+
+    def query(self, request):
+        k = _rows(request)
+        df = self.df.iloc[self.index.query(_filters(request))]
+        total = len(df)
+        sort_by = request.get('sort_by')
+        if sort_by:
+            df = df.iloc[top_k_index(df, _names(sort_by), k, request.get('ascending', False))]
+        else:
+            df = df.head(k)
+        return _table_json(total, df[_names(request['columns'])] if request.get('columns') else df)
+
+    def pareto(self, request):
+        k = _rows(request)
+        df = self.df.iloc[self.index.query(_filters(request))]
+        total = len(df)
+        df = df.iloc[pareto_index(df)].head(k)
+        return _table_json(total, df[_names(request['columns'])] if request.get('columns') else df)
+
+
+async def _read_request(reader):
+    # Minimal HTTP/1.1: request line, headers, Content-Length body. The body is None with the
+    # status to answer when the Content-Length is not usable.
+    request_line = (await reader.readline()).decode('latin-1').split()
+    if len(request_line) < 2:
+        raise ValueError("Malformed request line")
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = headers.get('content-length', '0')
+    if not length.isdigit():
+        return request_line[0], request_line[1], None, 400
+    if int(length) > MAX_BODY:
+        return request_line[0], request_line[1], None, 413
+    body = await reader.readexactly(int(length)) if int(length) else b''
+    return request_line[0], request_line[1], body, 200
+
+def _response(status, body):
+    body = body.encode()
+    head = (f'HTTP/1.1 {status} {STATUS_TEXT[status]}\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n')
+    return head.encode() + body
+
+async def _handle(service, executor, reader, writer):
+    try:
+        method, target, body, status = await _read_request(reader)
+        path = target.split('?')[0]
+        routes = {('GET', '/columns'): lambda request: service.columns(),
+                  ('POST', '/query'): service.query,
+                  ('POST', '/pareto'): service.pareto}
+        if status == 400:
+            payload = json.dumps({'error': "Content-Length is not a whole number"})
+        elif status == 413:
+            payload = json.dumps({'error': f"Request body over {MAX_BODY} bytes"})
+        elif (method, path) in routes:
+            try:
+                request = json.loads(body) if body else {}
+                if not isinstance(request, dict):
+                    raise ValueError("Request body must be a JSON object")
+                payload = await asyncio.get_running_loop().run_in_executor(executor, routes[(method, path)], request)
+                status = 200
+            except (KeyError, ValueError, TypeError, AttributeError) as error:
+                status, payload = 400, json.dumps({'error': str(error)})
+        elif path in {route_path for _, route_path in routes}:
+            status, payload = 405, json.dumps({'error': f"{method} not allowed on {path}"})
+        else:
+            status, payload = 404, json.dumps({'error': f"No endpoint {path}"})
+        writer.write(_response(status, payload))
+        await writer.drain()
+    except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(path, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=4):
+    """Load path once and answer queries until cancelled."""
+    service = SweepService(path)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    server = await asyncio.start_server(lambda reader, writer: _handle(service, executor, reader, writer), host, port)
+    print(f"Serving {path} ({len(service.df)} rows) on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False)
+
+
+class QueryClient:
+    """Client for a running Coil_Query_Server, results come back as DataFrames."""
+    def __init__(self, url=f'http://{DEFAULT_HOST}:{DEFAULT_PORT}', timeout=60):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _call(self, endpoint, request=None):
+        data = json.dumps(request).encode() if request is not None else None
+        http_request = urllib.request.Request(self.url + endpoint, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            raise ValueError(json.loads(error.read()).get('error', str(error))) from None
+
+    def _table(self, answer):
+        table = answer['table']
+        df = pd.DataFrame(table['data'], columns=table['columns']).astype(dict(zip(table['columns'], table['dtypes'])))
+        df.attrs['total'] = answer['total']         # Rows matching the filters before k was applied
+        return df
+
+    def columns(self):
+        return self._call('/columns')['columns']
+
+    def query(self, filters=None, sort_by=None, k=None, ascending=False, columns=None):
+        """Rows meeting filters ({column: (low, high)}), the top k by sort_by if given (the server caps k)."""
+        request = {'filters': {column: list(bounds) for column, bounds in (filters or {}).items()},
+                   'sort_by': _names(sort_by) if sort_by else None, 'k': k, 'ascending': ascending, 'columns': columns}
+        return self._table(self._call('/query', request))
+
+    def pareto(self, filters=None, k=None, columns=None):
+        """The Pareto frontier (Coil_Selection.pareto_front objectives) of the rows meeting filters."""
+        request = {'filters': {column: list(bounds) for column, bounds in (filters or {}).items()}, 'k': k, 'columns': columns}
+        return self._table(self._call('/pareto', request))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve queries on a sweep result kept in memory")
+    parser.add_argument('table', help="Sweep csv file or result store")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="Interface to listen on, localhost by default")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=4, help="Threads running queries")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.table, args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
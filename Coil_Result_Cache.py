@@ -0,0 +1,162 @@
+"""
+Title: Coil_Result_Cache
+
+On-disk cache of pipeline stage results, keyed by a hash of everything the stage depends on.
+A stage key covers the stage's code (and the code and constants of the functions it calls), the
+values of the params it declares, the keys of its input columns and the key of the current row
+set. Base columns are keyed by a hash of their contents, stage output columns by the key of the
+stage that made them, so a rerun only recomputes the stages downstream of whatever changed.
+
+Entries hold the stage's output column and, for stages that drop rows, the positions of the rows
+kept. The least recently used entries are evicted once the cache grows past max_bytes.
+"""
+import hashlib
+import os
+import shutil
+import types
+import uuid
+import numpy as np
+
+
+ROWS_KEY = '__rows__'  # Key of the row set in a keys dict, next to the column keys
+
+
+def hash_values(*values):
+    """Stable hex digest of numbers, strings, arrays and (nested) lists/tuples/dicts/ranges of them."""
+    h = hashlib.sha256()
+    for value in values:
+        _update_hash(h, value)
+    return h.hexdigest()
+
+def _update_hash(h, value):
+    if isinstance(value, np.ndarray) or hasattr(value, 'to_numpy'):
+        values = np.ascontiguousarray(value.to_numpy() if hasattr(value, 'to_numpy') else value)
+        h.update(f'array:{values.dtype.str}:{values.shape}:'.encode())
+        h.update(values.tobytes())
+    elif isinstance(value, (list, tuple, range)):
+        h.update(f'{type(value).__name__}:{len(value)}:'.encode())
+        for item in value:
+            _update_hash(h, item)
+    elif isinstance(value, dict):
+        h.update(f'dict:{len(value)}:'.encode())
+        for key in sorted(value, key=repr):
+            _update_hash(h, key)
+            _update_hash(h, value[key])
+    else:
+        h.update(f'{type(value).__name__}:{value!r};'.encode())
+
+def code_fingerprint(func):
+    """Hash of a function's bytecode and constants, and of every module level function or
+    plain constant it uses by name, followed recursively. Comments and formatting don't count."""
+    h = hashlib.sha256()
+    seen = set()
+
+    def visit(code, module_globals):
+        if code in seen:
+            return
+        seen.add(code)
+        h.update(code.co_code)
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                visit(const, module_globals)
+            else:
+                h.update(repr(const).encode())
+        for name in code.co_names:
+            value = module_globals.get(name)
+            if isinstance(value, types.FunctionType):
+                _update_hash(h, value.__defaults__)
+                visit(value.__code__, value.__globals__)
+            elif isinstance(value, (int, float, str, bool, tuple, list, dict, range)):
+                h.update(name.encode())
+                _update_hash(h, value)
+
+    visit(func.__code__, func.__globals__)
+    return h.hexdigest()
+
+def stage_key(stage, params, keys):
+    """Key of a stage given the params and the keys of the table it runs on."""
+    return hash_values(
+        'stage', stage.name, stage.column, tuple(stage.inputs),
+        code_fingerprint(stage.func),
+        {name: params[name] for name in stage.params},
+        [keys[column] for column in stage.inputs],
+        keys[ROWS_KEY])
+
+def key_table(df, keys):
+    """Give every column of df that has no key yet a key from its contents, and the rows a key from those."""
+    for column in df.columns:
+        if column not in keys:
+            keys[column] = hash_values('column', column, df[column])
+    if ROWS_KEY not in keys:
+        keys[ROWS_KEY] = hash_values('rows', len(df), [keys[column] for column in df.columns])
+    return keys
+
+
+class ResultCache:
+    """Directory of cached stage results with least-recently-used eviction past max_bytes."""
+    def __init__(self, path='.coil_cache', max_bytes=2 * 1024 ** 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.path, key)
+
+    def get(self, key):
+        """(column values, kept row positions or None) for key, or None on a miss."""
+        entry = self._entry(key)
+        try:
+            values = np.load(os.path.join(entry, 'column.npy'))
+            rows_file = os.path.join(entry, 'rows.npy')
+            rows = np.load(rows_file) if os.path.exists(rows_file) else None
+            os.utime(entry)                             # Mark as recently used
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        return values, rows
+
+    def put(self, key, values, rows=None):
+        entry = self._entry(key)
+        if os.path.exists(entry):
+            return
+        # Written to a temporary directory and renamed so readers never see half an entry
+        tmp = os.path.join(self.path, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(tmp)
+        np.save(os.path.join(tmp, 'column.npy'), np.asarray(values))
+        if rows is not None:
+            np.save(os.path.join(tmp, 'rows.npy'), np.asarray(rows))
+        try:
+            os.rename(tmp, entry)
+        except OSError:                                 # Another process wrote the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """(key, bytes, last used) for every entry, oldest first."""
+        entries = []
+        for key in os.listdir(self.path):
+            entry = self._entry(key)
+            if key.startswith('.') or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+                entries.append((key, size, os.path.getmtime(entry)))
+            except OSError:
+                continue
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes=None):
+        """Remove least recently used entries until the cache is at most max_bytes."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        self.evict(0)
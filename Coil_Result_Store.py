@@ -0,0 +1,222 @@
+"""
+Title: Coil_Result_Store
+
+Columnar result store for the coil sweeps.
+A store is a directory (named *.coils by default) holding one raw binary file per column and a
+manifest.json with the number of rows, each column's dtype and unit and, when given, the sweep
+params the table was made with. Columns are memory-mapped
+on load so only the columns (and rows) that are asked for are ever read from disk.
+
+load_table, table_columns and save_table work with both stores and csv files so the pipeline in
+Coil_Parameter_Selection and the CoilSelectorApp GUI can use either.
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+STORE_SUFFIX = '.coils'
+STORE_MANIFEST = 'manifest.json'
+STORE_VERSION = 1
+
+# Column: (dtype, unit). Columns not listed keep the dtype they have in the DataFrame
+COLUMN_SCHEMA = {
+    'CSV_CoilNumber': ('uint32', ''),
+    'CSV_OutterDiameter': ('uint32', 'um'),
+    'CSV_TraceWidth': ('uint16', 'um'),
+    'CSV_TraceSpacing': ('uint16', 'um'),
+    'CSV_TurnsPerLayer': ('uint16', 'turns'),
+    'CSV_TankCap': ('uint32', 'pF'),
+    'CSV_InnerDiameter': ('int32', 'um'),
+    'CSV_AvgDiameter': ('int32', 'um'),
+    'CSV_CFR': ('int32', 'ppm'),                     # Inner / outer diameter * 1e6
+    'CSV_CoilInductance': ('int64', 'pH'),
+    'CSV_SensorFreq': ('int64', 'Hz'),               # The 1e12 scaling cancels out with L in pH and C in pF
+    'CSV_SeriesACResistance': ('int64', 'zOhm'),
+    'CSV_TraceLength': ('int32', 'um'),
+    'CSV_DCResistance': ('int64', 'mOhm'),
+    'CSV_Qfactor': ('float64', ''),
+}
+
+
+def params_json(params):
+    """Sweep params as plain JSON values, ranges as {"start", "stop", "step"} like the Coil_Batch_Sweep specs."""
+    if isinstance(params, dict):
+        return {name: params_json(value) for name, value in params.items()}
+    if isinstance(params, range):
+        return {'start': params.start, 'stop': params.stop, 'step': params.step}
+    if isinstance(params, (list, tuple, np.ndarray)):
+        return [params_json(value) for value in params]
+    return params.item() if isinstance(params, np.generic) else params
+
+def params_from_json(params):
+    """Sweep params back from params_json."""
+    if isinstance(params, dict):
+        if set(params) == {'start', 'stop', 'step'}:
+            return range(params['start'], params['stop'], params['step'])
+        return {name: params_from_json(value) for name, value in params.items()}
+    return params
+
+def is_store(path):
+    path = _store_dir(path)
+    return os.path.isfile(os.path.join(path, STORE_MANIFEST))
+
+def _store_dir(path):
+    # Accept the store directory or the manifest inside it (file dialogs can only pick files)
+    path = os.fspath(path)
+    if os.path.basename(path) == STORE_MANIFEST:
+        return os.path.dirname(path)
+    return path
+
+def _column_dtype(column, values):
+    # Schema dtype for the column, as long as every value fits in it
+    if column not in COLUMN_SCHEMA:
+        return values.dtype
+    dtype = np.dtype(COLUMN_SCHEMA[column][0])
+    if dtype.kind in 'iu' and values.dtype.kind in 'iu' and len(values):
+        info = np.iinfo(dtype)
+        if values.min() < info.min or values.max() > info.max:
+            return values.dtype
+    elif dtype.kind in 'iu' and values.dtype.kind not in 'iu':
+        return values.dtype
+    return dtype
+
+
+class StoreWriter:
+    """Write a store chunk by chunk, the manifest is written on close().
+
+    params (the sweep_params the table comes from) are kept in the manifest, see store_params.
+
+    with StoreWriter('coil_parameters_20mm.coils') as writer:
+        for df in chunks:
+            writer.append(df)
+    """
+    def __init__(self, path, params=None):
+        self.path = _store_dir(path)
+        self.params = params
+        self.columns = None
+        self.dtypes = {}
+        self.rows = 0
+        os.makedirs(self.path, exist_ok=True)
+        manifest_path = os.path.join(self.path, STORE_MANIFEST)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)                # The store is only valid again once close() runs
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+            for column in self.columns:
+                self.dtypes[column] = _column_dtype(column, df[column].to_numpy())
+                if self.dtypes[column].kind not in 'biuf':
+                    raise ValueError(f"Column {column} is not numeric, a store can only hold numeric columns")
+                open(self._column_file(column), 'wb').close()
+        elif list(df.columns) != self.columns:
+            raise ValueError(f"Chunk columns {list(df.columns)} do not match the store columns {self.columns}")
+        for column in self.columns:
+            values = df[column].to_numpy()
+            dtype = self.dtypes[column]
+            if dtype.kind in 'iu' and len(values):
+                info = np.iinfo(dtype)
+                if values.min() < info.min or values.max() > info.max:
+                    raise ValueError(f"Values of {column} do not fit in the store dtype {dtype}")
+            with open(self._column_file(column), 'ab') as f:
+                np.ascontiguousarray(values, dtype=dtype.newbyteorder('<')).tofile(f)
+        self.rows += len(df)
+
+    def close(self):
+        manifest = {
+            'version': STORE_VERSION,
+            'rows': self.rows,
+            'columns': [{
+                'name': column,
+                'dtype': self.dtypes[column].newbyteorder('<').str,
+                'unit': COLUMN_SCHEMA.get(column, ('', ''))[1],
+                'file': os.path.basename(self._column_file(column)),
+            } for column in self.columns or []],
+        }
+        if self.params is not None:
+            manifest['params'] = params_json(self.params)
+        with open(os.path.join(self.path, STORE_MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    def _column_file(self, column):
+        return os.path.join(self.path, f'{column}.bin')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+def write_store(df, path, params=None):
+    with StoreWriter(path, params) as writer:
+        writer.append(df)
+
+def store_info(path):
+    """The manifest of a store: rows and per column name, dtype, unit and file."""
+    with open(os.path.join(_store_dir(path), STORE_MANIFEST)) as f:
+        return json.load(f)
+
+def read_store(path, columns=None, rows=None):
+    """Load a store as a DataFrame.
+
+    Only the requested columns are mapped, rows (an index array or boolean mask)
+    picks rows straight out of the memory map without reading the rest.
+    """
+    path = _store_dir(path)
+    manifest = store_info(path)
+    entries = {entry['name']: entry for entry in manifest['columns']}
+    if columns is None:
+        columns = list(entries)
+    missing = [column for column in columns if column not in entries]
+    if missing:
+        raise KeyError(f"Column(s) not in store {path}: {', '.join(missing)}")
+    data = {}
+    for column in columns:
+        entry = entries[column]
+        if manifest['rows'] == 0:
+            values = np.empty(0, dtype=entry['dtype'])
+        else:
+            values = np.memmap(os.path.join(path, entry['file']), dtype=entry['dtype'], mode='r', shape=(manifest['rows'],))
+        if rows is not None:
+            values = values[rows]
+        data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+def store_units(path):
+    return {entry['name']: entry['unit'] for entry in store_info(path)['columns']}
+
+def store_params(path):
+    """The sweep params a store was written with, None for csv files and stores without them."""
+    if not is_store(path):
+        return None
+    params = store_info(path).get('params')
+    return params_from_json(params) if params is not None else None
+
+
+def load_table(path, columns=None, rows=None):
+    """Load a sweep result from a store or a csv file, optionally only some columns/rows."""
+    if is_store(path):
+        return read_store(path, columns, rows)
+    df = pd.read_csv(path, usecols=columns)
+    if columns is not None:
+        df = df[list(columns)]
+    if rows is not None:
+        df = df.iloc[rows] if np.asarray(rows).dtype != bool else df[np.asarray(rows)]
+    return df
+
+def table_columns(path):
+    """Column names of a store or csv file without loading any data."""
+    if is_store(path):
+        return [entry['name'] for entry in store_info(path)['columns']]
+    return list(pd.read_csv(path, nrows=0).columns)
+
+def save_table(df, path, params=None):
+    """Write a csv file if path ends in .csv, otherwise a store (which also keeps params)."""
+    if os.fspath(path).endswith('.csv'):
+        df.to_csv(path, index=False)
+    else:
+        write_store(df, path, params)
@@ -0,0 +1,124 @@
+"""
+Title: Coil_Selection
+
+Picking coils out of a sweep without sorting the whole table.
+top_k partitions on the first sort key (np.argpartition, O(n)) and only sorts the rows that can
+still make the top k. pareto_front returns the coils that no other coil beats on every objective
+at once: high inductance, low DC/AC resistance and high Q by default.
+"""
+import numpy as np
+import pandas as pd
+
+
+# Objectives used by pareto_front when none are given
+PARETO_MAXIMIZE = ('CSV_CoilInductance', 'CSV_Qfactor')
+PARETO_MINIMIZE = ('CSV_DCResistance', 'CSV_SeriesACResistance')
+
+
+def _rank_key(values, ascending):
+    # Key where smaller is better, NaN sorts last so it is always the worst
+    values = np.asarray(values)
+    if values.dtype.kind in 'ub':
+        values = values.astype(np.int64)
+    return values if ascending else -values
+
+def _directions(by, ascending):
+    if isinstance(by, str):
+        by = [by]
+    if isinstance(ascending, bool):
+        ascending = [ascending] * len(by)
+    if len(ascending) != len(by):
+        raise ValueError(f"Got {len(ascending)} ascending flags for {len(by)} sort columns")
+    return list(by), list(ascending)
+
+def top_k_index(df, by, k, ascending=False):
+    """Positions of the top k rows of df sorted by the columns in by, best first."""
+    by, ascending = _directions(by, ascending)
+    keys = [_rank_key(df[column].to_numpy(), asc) for column, asc in zip(by, ascending)]
+    n = len(df)
+    k = max(0, min(int(k), n))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < n:
+        # Everything that ties with the k-th value of the first key can still make it
+        kth = np.partition(keys[0], k - 1)[k - 1]
+        candidates = np.arange(n) if np.isnan(kth) else np.flatnonzero(keys[0] <= kth)
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort([key[candidates] for key in reversed(keys)])
+    return candidates[order[:k]]
+
+def top_k(df, by, k, ascending=False):
+    """The top k rows of df sorted by the columns in by, same result as df.sort_values(by, ascending).head(k)."""
+    return df.iloc[top_k_index(df, by, k, ascending)]
+
+def merge_top_k(frames, by, k, ascending=False):
+    """Top k over several DataFrames, e.g. a running top k and the next chunk of a sweep."""
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return None
+    return top_k(pd.concat(frames), by, k, ascending)
+
+
+def pareto_index(df, maximize=PARETO_MAXIMIZE, minimize=PARETO_MINIMIZE, block_rows=2048, front_rows=1024):
+    """Positions of the non-dominated rows of df.
+
+    A row is dominated when another row is at least as good on every objective and
+    better on one. The front of an evenly spaced sample of block_rows rows first knocks
+    out most of the table. The rest is visited best first in lexicographic order, where a
+    row can only be dominated by one visited before it, and each block of rows is checked
+    against the front found so far and against itself, so the front only ever grows.
+    """
+    columns = list(maximize) + list(minimize)
+    if not columns:
+        raise ValueError("pareto_index needs at least one objective")
+    # Larger is better for every objective
+    points = np.column_stack([df[column].to_numpy(dtype=float) for column in maximize] +
+                             [-df[column].to_numpy(dtype=float) for column in minimize])
+    valid = np.flatnonzero(~np.isnan(points).any(axis=1))
+    points = points[valid]
+    if len(points) > 2 * block_rows:
+        sample = points[np.linspace(0, len(points) - 1, block_rows).astype(np.intp)]
+        sample = sample[_front_positions(sample, block_rows, front_rows)]
+        survivors = np.ones(len(points), dtype=bool)
+        for start in range(0, len(points), block_rows):
+            for front_start in range(0, len(sample), front_rows):
+                survivors[start:start + block_rows] &= ~_dominated_by(points[start:start + block_rows], sample[front_start:front_start + front_rows])
+        valid = valid[survivors]
+        points = points[survivors]
+    return valid[_front_positions(points, block_rows, front_rows)]
+
+def _front_positions(points, block_rows, front_rows):
+    # Exact non-dominated rows of points (larger is better), see pareto_index
+    order = np.lexsort([-points[:, j] for j in reversed(range(points.shape[1]))])
+    front = np.empty((0, points.shape[1]))
+    front_positions = []
+    for start in range(0, len(order), block_rows):
+        block = order[start:start + block_rows]
+        block_points = points[block]
+        dominated = np.zeros(len(block), dtype=bool)
+        for front_start in range(0, len(front), front_rows):
+            dominated |= _dominated_by(block_points, front[front_start:front_start + front_rows])
+        block = block[~dominated]
+        block_points = block_points[~dominated]
+        keep = ~_dominated_by(block_points, block_points)
+        front = np.vstack([front, block_points[keep]])
+        front_positions.append(block[keep])
+    if not front_positions:
+        return np.empty(0, dtype=np.intp)
+    return np.concatenate(front_positions)
+
+def _dominated_by(points, others):
+    # True for each point that some row of others dominates
+    if len(points) == 0 or len(others) == 0:
+        return np.zeros(len(points), dtype=bool)
+    at_least = np.ones((len(points), len(others)), dtype=bool)
+    better = np.zeros((len(points), len(others)), dtype=bool)
+    for j in range(points.shape[1]):
+        at_least &= others[None, :, j] >= points[:, None, j]
+        better |= others[None, :, j] > points[:, None, j]
+    return (at_least & better).any(axis=1)
+
+def pareto_front(df, maximize=PARETO_MAXIMIZE, minimize=PARETO_MINIMIZE):
+    """The non-dominated coils of df, best first by the objectives in the order given."""
+    return df.iloc[pareto_index(df, maximize, minimize)]
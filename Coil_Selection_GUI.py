@@ -1,9 +1,21 @@
+import os
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog
+from tkinter import messagebox
 import pandas as pd
+from Coil_Parameter_Selection import SENSITIVITY_CONSTANTS, what_if_ranking
+from Coil_Query_Engine import SweepIndex
+from Coil_Query_Server import QueryClient
+from Coil_Result_Store import load_table, store_params, table_columns
+from Coil_Selection import top_k_index
 
 class CoilSelectorApp:
+    # Treeview rows that exist at any time, scrolling reuses them for other coils
+    page_rows = 25
+
     def __init__(self, root):
         self.root = root
         self.root.title("Coil Selector")
@@ -12,12 +24,32 @@ class CoilSelectorApp:
         self.csv_file_name = tk.StringVar()
         self.sort_options = []
         self.num_rows_displayed = tk.IntVar()
+        self.status = tk.StringVar()
+        self.filters = {}                   # Column: (min, max), None leaves a side open
+        self.filter_min = tk.StringVar()
+        self.filter_max = tk.StringVar()
+        self.filters_text = tk.StringVar()
+        self.what_if = tk.StringVar()             # e.g. "copper_thickness=17.5, C1=1.3"
 
         # Set default values
         self.csv_file_name.set('coil_parameters_10mm.csv')
         self.sort_options = ['CSV_CoilInductance']
         self.num_rows_displayed.set(10)
 
+        # Table loading and sorting runs on a worker thread, results come back through a queue
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._table = None                  # Loaded table, only touched by the worker thread
+        self._table_key = None
+        self._index = None                  # SweepIndex over _table for the filters
+        self._params = None                 # Sweep params recorded with _table, if any
+        self._view = pd.DataFrame()         # Rows shown in the table
+        self._offset = 0                    # Index in _view of the first visible row
+        threading.Thread(target=self._worker, daemon=True).start()
+        self.root.after(50, self._poll_results)
+
+        headers = self.get_csv_headers()
+
         # Frame for parameter selection
         parameter_frame = ttk.Frame(root, padding="10")
         parameter_frame.grid(row=0, column=0, sticky="nsew")
@@ -29,28 +61,64 @@ class CoilSelectorApp:
 
         # Sort Options
         ttk.Label(parameter_frame, text="Sort Options:").grid(row=1, column=0, sticky="w")
-        sort_options_combobox = ttk.Combobox(parameter_frame, values=self.get_csv_headers(), state="readonly", height=5)
-        sort_options_combobox.set(self.sort_options[0])
-        sort_options_combobox.grid(row=1, column=1, padx=5, pady=5)
-        ttk.Button(parameter_frame, text="Add", command=lambda: self.add_sort_option(sort_options_combobox)).grid(row=1, column=2, padx=5, pady=5)
+        self.sort_options_combobox = ttk.Combobox(parameter_frame, values=headers, state="readonly", height=5)
+        self.sort_options_combobox.set(self.sort_options[0])
+        self.sort_options_combobox.grid(row=1, column=1, padx=5, pady=5)
+        ttk.Button(parameter_frame, text="Add", command=lambda: self.add_sort_option(self.sort_options_combobox)).grid(row=1, column=2, padx=5, pady=5)
 
         # Number of Rows Displayed
         ttk.Label(parameter_frame, text="Number of Rows Displayed:").grid(row=2, column=0, sticky="w")
         ttk.Entry(parameter_frame, textvariable=self.num_rows_displayed).grid(row=2, column=1, padx=5, pady=5)
 
+        # Filters, e.g. CSV_SensorFreq between the sensor IC's band limits
+        ttk.Label(parameter_frame, text="Filter:").grid(row=3, column=0, sticky="w")
+        self.filter_combobox = ttk.Combobox(parameter_frame, values=headers, state="readonly", height=5)
+        self.filter_combobox.grid(row=3, column=1, padx=5, pady=5)
+        ttk.Button(parameter_frame, text="Add Filter", command=self.add_filter).grid(row=3, column=2, padx=5, pady=5)
+        ttk.Label(parameter_frame, text="Min / Max:").grid(row=4, column=0, sticky="w")
+        range_frame = ttk.Frame(parameter_frame)
+        range_frame.grid(row=4, column=1, padx=5, pady=5)
+        ttk.Entry(range_frame, textvariable=self.filter_min, width=10).grid(row=0, column=0)
+        ttk.Entry(range_frame, textvariable=self.filter_max, width=10).grid(row=0, column=1)
+        ttk.Button(parameter_frame, text="Clear Filters", command=self.clear_filters).grid(row=4, column=2, padx=5, pady=5)
+        ttk.Label(parameter_frame, textvariable=self.filters_text).grid(row=5, column=0, columnspan=3, sticky="w")
+
+        # What-if constants, the ranking is re-estimated from the sensitivities instead of a new sweep
+        ttk.Label(parameter_frame, text="What-if Constants:").grid(row=6, column=0, sticky="w")
+        ttk.Entry(parameter_frame, textvariable=self.what_if).grid(row=6, column=1, padx=5, pady=5)
+        ttk.Label(parameter_frame, text=", ".join(SENSITIVITY_CONSTANTS)).grid(row=6, column=2, sticky="w")
+
         # Apply Button
-        ttk.Button(parameter_frame, text="Apply", command=self.apply_filters).grid(row=3, column=0, columnspan=3, pady=10)
+        ttk.Button(parameter_frame, text="Apply", command=self.apply_filters).grid(row=7, column=0, columnspan=3, pady=10)
+        ttk.Label(parameter_frame, textvariable=self.status).grid(row=8, column=0, columnspan=3, sticky="w")
 
         # Frame for displaying coil table
         table_frame = ttk.Frame(root, padding="10")
         table_frame.grid(row=1, column=0, sticky="nsew")
 
         # Table
-        # Table
-        self.coil_table = ttk.Treeview(table_frame)
-        self.coil_table["columns"] = tuple(self.get_csv_headers())
+        self.coil_table = ttk.Treeview(table_frame, height=self.page_rows)
         self.coil_table["show"] = "headings"
+        self.set_table_columns(headers)
+        self.coil_table.grid(row=0, column=0, sticky="nsew")
+        for _ in range(self.page_rows):
+            self.coil_table.insert("", "end", values=())
 
+        # Scrollbars, the vertical one scrolls through _view rather than the Treeview items
+        self.y_scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.scroll_table)
+        self.y_scrollbar.grid(row=0, column=1, sticky="ns")
+        self.coil_table.bind("<MouseWheel>", lambda event: self.scroll_table("scroll", -1 if event.delta > 0 else 1, "units"))
+        self.coil_table.bind("<Button-4>", lambda event: self.scroll_table("scroll", -1, "units"))
+        self.coil_table.bind("<Button-5>", lambda event: self.scroll_table("scroll", 1, "units"))
+
+        x_scrollbar = ttk.Scrollbar(table_frame, orient="horizontal", command=self.coil_table.xview)
+        x_scrollbar.grid(row=1, column=0, sticky="ew")
+        self.coil_table.configure(xscrollcommand=x_scrollbar.set)
+
+        root.grid_rowconfigure(1, weight=1)
+        root.columnconfigure(0, weight=1)
+
+    def set_table_columns(self, headers):
         # Set column widths (adjust these values as needed)
         column_widths = {
             "CSV_CoilNumber": 80,
@@ -66,27 +134,22 @@ class CoilSelectorApp:
             "CSV_SensorFreq":100
         }
 
-        for header in self.get_csv_headers():
+        self.coil_table["columns"] = tuple(headers)
+        for header in headers:
             self.coil_table.heading(header, text=header, anchor="center")
             self.coil_table.column(header, width=column_widths.get(header, 100), anchor="center")
-        self.coil_table.grid(row=0, column=0, sticky="nsew")
-
-        # Scrollbars
-        y_scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.coil_table.yview)
-        y_scrollbar.grid(row=0, column=1, sticky="ns")
-        self.coil_table.configure(yscrollcommand=y_scrollbar.set)
-
-        x_scrollbar = ttk.Scrollbar(table_frame, orient="horizontal", command=self.coil_table.xview)
-        x_scrollbar.grid(row=1, column=0, sticky="ew")
-        self.coil_table.configure(xscrollcommand=x_scrollbar.set)
-
-        root.grid_rowconfigure(1, weight=1)
-        root.columnconfigure(0, weight=1)
 
     def browse_csv(self):
-        file_path = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv")])
+        # A result store is opened by picking the manifest.json inside it
+        file_path = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv"), ("Result Stores", "manifest.json")])
         if file_path:
             self.csv_file_name.set(file_path)
+            headers = self.get_csv_headers()
+            self.sort_options_combobox.configure(values=headers)
+            self.filter_combobox.configure(values=headers)
+            self.clear_filters()
+            self.set_table_columns(headers)
+            self.update_coil_table(pd.DataFrame(columns=headers))
 
     def add_sort_option(self, combobox):
         selected_option = combobox.get()
@@ -98,26 +161,137 @@ class CoilSelectorApp:
         sort_options_str = ", ".join(self.sort_options)
         tk.messagebox.showinfo("Sort Options", f"Current Sort Options: {sort_options_str}")
 
+    def add_filter(self):
+        column = self.filter_combobox.get()
+        try:
+            low = float(self.filter_min.get()) if self.filter_min.get().strip() else None
+            high = float(self.filter_max.get()) if self.filter_max.get().strip() else None
+        except ValueError:
+            messagebox.showerror("Filters", "Min and Max must be numbers or left empty")
+            return
+        if not column or (low is None and high is None):
+            messagebox.showerror("Filters", "Pick a column and give a Min and/or Max")
+            return
+        self.filters[column] = (low, high)
+        self.update_filters_text()
+
+    def clear_filters(self):
+        self.filters = {}
+        self.update_filters_text()
+
+    def update_filters_text(self):
+        parts = []
+        for column, (low, high) in self.filters.items():
+            parts.append(f"{'' if low is None else f'{low:g} <= '}{column}{'' if high is None else f' <= {high:g}'}")
+        self.filters_text.set("Filters: " + ", ".join(parts) if parts else "")
+
+    def is_server(self, path):
+        # An http:// address is a running Coil_Query_Server instead of a file
+        return path.startswith(('http://', 'https://'))
+
     def get_csv_headers(self):
-        df = pd.read_csv(self.csv_file_name.get())
-        return list(df.columns)
+        # Header only, no rows are read
+        path = self.csv_file_name.get()
+        return QueryClient(path).columns() if self.is_server(path) else table_columns(path)
+
+    def get_what_if(self):
+        # "name=value, name=value" to {name: value}
+        changes = {}
+        for part in self.what_if.get().split(','):
+            if part.strip():
+                name, _, value = part.partition('=')
+                changes[name.strip()] = float(value)
+        return changes
 
     def apply_filters(self):
-        df = pd.read_csv(self.csv_file_name.get())
-        df = df.sort_values(by=self.sort_options, ascending=False)
-        num_rows = self.num_rows_displayed.get()
-        df = df.head(num_rows)
-        self.update_coil_table(df)
+        try:
+            changes = self.get_what_if()
+        except ValueError:
+            messagebox.showerror("What-if", "Give the constants as name=value, separated by commas")
+            return
+        self.status.set("Loading...")
+        self._requests.put({
+            'path': self.csv_file_name.get(),
+            'sort_options': list(self.sort_options),
+            'num_rows': self.num_rows_displayed.get(),
+            'filters': dict(self.filters),
+            'what_if': changes,
+        })
+
+    def _worker(self):
+        # Background thread: load the table (kept across Apply clicks until the file changes), filter it and rank it
+        while True:
+            request = self._requests.get()
+            while not self._requests.empty():       # Only the latest Apply click matters
+                request = self._requests.get()
+            try:
+                path = request['path']
+                if self.is_server(path):
+                    # The server keeps the table loaded and does the filtering and ranking
+                    if request['what_if']:
+                        raise ValueError("What-if constants need a local file, not a query server")
+                    rows = QueryClient(path).query(request['filters'], request['sort_options'], request['num_rows'])
+                    self._results.put(('rows', rows))
+                    continue
+                key = (path, os.path.getmtime(path))
+                if key != self._table_key:
+                    self._table = load_table(path)
+                    self._params = store_params(path)      # None keeps the sweep_params defaults
+                    self._table_key = key
+                    self._index = SweepIndex(self._table)
+                if request['what_if']:
+                    # The filters are checked on the recomputed values, coils can move into or out of them
+                    self._results.put(('rows', what_if_ranking(self._table, request['what_if'], request['sort_options'], request['num_rows'],
+                                                               params=self._params, filters=request['filters'])))
+                    continue
+                table = self._table.iloc[self._index.query(request['filters'])]
+                rows = top_k_index(table, request['sort_options'], request['num_rows'])
+                self._results.put(('rows', table.iloc[rows]))
+            except Exception as error:
+                self._results.put(('error', str(error)))
+
+    def _poll_results(self):
+        try:
+            while True:
+                kind, result = self._results.get_nowait()
+                if kind == 'error':
+                    self.status.set("")
+                    messagebox.showerror("Coil Selector", result)
+                else:
+                    if list(result.columns) != list(self.coil_table["columns"]):
+                        self.set_table_columns(list(result.columns))
+                    self.update_coil_table(result)
+                    self.status.set(f"{len(result)} coils")
+        except queue.Empty:
+            pass
+        self.root.after(50, self._poll_results)
 
     def update_coil_table(self, dataframe):
-        # Clear existing items in the table
-        for item in self.coil_table.get_children():
-            self.coil_table.delete(item)
-
-        # Insert new data into the table
-        for index, row in dataframe.iterrows():
-            values = tuple(row)
-            self.coil_table.insert("", "end", values=values)
+        self._view = dataframe
+        self._offset = 0
+        self.render_page()
+
+    def scroll_table(self, *args):
+        # Scrollbar/mouse wheel callback with the same arguments as Treeview.yview
+        last_offset = max(len(self._view) - self.page_rows, 0)
+        if args[0] == "moveto":
+            offset = int(round(float(args[1]) * len(self._view)))
+        elif args[2] == "pages":
+            offset = self._offset + int(args[1]) * self.page_rows
+        else:
+            offset = self._offset + int(args[1])
+        self._offset = min(max(offset, 0), last_offset)
+        self.render_page()
+
+    def render_page(self):
+        # Only the visible rows are turned into Treeview values
+        page = self._view.iloc[self._offset:self._offset + self.page_rows]
+        items = self.coil_table.get_children()
+        rows = list(page.itertuples(index=False, name=None))
+        for i, item in enumerate(items):
+            self.coil_table.item(item, values=rows[i] if i < len(rows) else ())
+        total = max(len(self._view), 1)
+        self.y_scrollbar.set(self._offset / total, min((self._offset + self.page_rows) / total, 1.0))
 
 
 
@@ -0,0 +1,149 @@
+"""
+Title: Coil_Tolerance_Analysis
+
+Monte Carlo check of how manufacturing tolerances move the shortlisted coils. Trace width and
+spacing (etching), copper thickness and the tank capacitor are perturbed at random, samples per
+coil at a time, and every sample goes through the same array models as the sweep
+(inner/average diameter, fill ratio, inductance, sensor frequency, Rs, trace length, DC resistance
+and Q) as one (coils x samples) array computation. The report per coil is the yield, the share
+of samples whose sensor frequency stays inside the band, and the spread of the frequency.
+
+Tolerances are the +/- limits: trace width and spacing in um, copper thickness and tank capacitor
+relative. With distribution='normal' the limits are taken as 3 sigma, with 'uniform' as the edges.
+
+python Coil_Tolerance_Analysis.py coil_parameters_20mm.coils --band 4e5 6e5 --samples 10000
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+import Coil_Parameter_Selection as cps
+from Coil_Result_Store import load_table, store_params
+from Coil_Selection import top_k
+
+
+TOLERANCES = {
+    'trace_width': 20,          # um
+    'trace_spacing': 20,        # um
+    'copper_thickness': 0.10,   # relative
+    'tank_cap': 0.05,           # relative, +/-5% capacitors
+}
+
+
+def _draw(rng, shape, tolerance, distribution):
+    # Offsets in units of the tolerance
+    if distribution == 'normal':
+        return rng.standard_normal(shape) * (tolerance / 3)
+    if distribution == 'uniform':
+        return rng.uniform(-tolerance, tolerance, shape)
+    raise ValueError(f"Unknown distribution '{distribution}', expected 'normal' or 'uniform'")
+
+def coil_models(tw, ts, turns, od, tank_cap, params):
+    """Every model column for arrays of coils (any broadcastable shapes), NaN where the coil does not fit.
+
+    The sweep truncates each stage's column to an integer, this keeps the values as floats.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inner = cps.calculate_inner_diameter(tw, ts, turns, od)
+        cfr = cps.calculate_coil_fill_ratio(od, inner)
+        fits = (inner >= 0) & (cfr >= params['min_coil_fill_ratio'])
+        avg = cps.calculate_avg_diameter(inner, od)
+        inductance = np.where(fits, cps.calculate_total_inductance_array(turns, avg, cfr, **params['inductance_fit']), np.nan)
+        freq = cps.calculate_sensor_frequency_array(inductance, tank_cap)
+        rs = cps.calculate_R_s_array(freq, tw, params['copper_thickness'])
+        length = cps.calculate_trace_length_array(od, turns, tw, ts, params['spiral_shape'])
+        dcr = cps.calculate_dc_resistance_array(length, tw, params['copper_thickness'])
+        q = cps.calculate_q_factor_array(freq, inductance, dcr)
+    return {
+        'CSV_CoilInductance': inductance,
+        'CSV_SensorFreq': freq,
+        'CSV_SeriesACResistance': rs,
+        'CSV_DCResistance': dcr,
+        'CSV_Qfactor': q,
+    }
+
+def monte_carlo(coils, freq_band=None, samples=10000, tolerances=None, distribution='normal', params=None, seed=0, block_values=2000000, band_tolerance=0.1):
+    """Yield and frequency spread for every row of coils (sweep rows).
+
+    freq_band is (low, high) in the units of CSV_SensorFreq, without one each coil is held to its
+    own nominal frequency +/- band_tolerance (relative). tolerances override TOLERANCES. Coils are
+    run in blocks of about block_values samples to bound memory. Returns one row per coil with
+    its number, geometry and tank cap, and the sample statistics.
+    """
+    if params is None:
+        params = cps.sweep_params()
+    tolerances = {**TOLERANCES, **(tolerances or {})}
+    unknown = set(tolerances) - set(TOLERANCES)
+    if unknown:
+        raise KeyError(f"Unknown tolerance(s): {', '.join(sorted(unknown))}")
+    rng = np.random.default_rng(seed)
+    nominal = {name: coils[name].to_numpy(dtype=float)[:, None] for name in
+               ('CSV_TraceWidth', 'CSV_TraceSpacing', 'CSV_TurnsPerLayer', 'CSV_OutterDiameter', 'CSV_TankCap', 'CSV_SensorFreq')}
+    block = max(1, block_values // samples)
+    results = []
+    for start in range(0, len(coils), block):
+        coil = {name: values[start:start + block] for name, values in nominal.items()}
+        shape = (len(coil['CSV_TraceWidth']), samples)
+        tw = coil['CSV_TraceWidth'] + _draw(rng, shape, tolerances['trace_width'], distribution)
+        ts = coil['CSV_TraceSpacing'] + _draw(rng, shape, tolerances['trace_spacing'], distribution)
+        cap = coil['CSV_TankCap'] * (1 + _draw(rng, shape, tolerances['tank_cap'], distribution))
+        sample_params = dict(params, copper_thickness=params['copper_thickness'] * (1 + _draw(rng, shape, tolerances['copper_thickness'], distribution)))
+        models = coil_models(tw, ts, coil['CSV_TurnsPerLayer'], coil['CSV_OutterDiameter'], cap, sample_params)
+        freq = models['CSV_SensorFreq']
+        if freq_band is None:
+            low = coil['CSV_SensorFreq'] * (1 - band_tolerance)
+            high = coil['CSV_SensorFreq'] * (1 + band_tolerance)
+        else:
+            low, high = freq_band
+        with np.errstate(invalid='ignore'):
+            in_band = (freq >= low) & (freq <= high)
+        results.append(pd.DataFrame({
+            'MC_Yield': in_band.mean(axis=1),
+            'MC_Fits': np.isfinite(freq).mean(axis=1),
+            'MC_FreqMean': np.nanmean(freq, axis=1),
+            'MC_FreqStd': np.nanstd(freq, axis=1),
+            'MC_FreqP05': np.nanpercentile(freq, 5, axis=1),
+            'MC_FreqP95': np.nanpercentile(freq, 95, axis=1),
+            'MC_InductanceStd': np.nanstd(models['CSV_CoilInductance'], axis=1),
+            'MC_DCResistanceMean': np.nanmean(models['CSV_DCResistance'], axis=1),
+            'MC_QfactorMean': np.nanmean(models['CSV_Qfactor'], axis=1),
+        }))
+    report = pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+    coil_columns = coils[['CSV_CoilNumber', 'CSV_TraceWidth', 'CSV_TraceSpacing', 'CSV_TurnsPerLayer', 'CSV_TankCap', 'CSV_SensorFreq']]
+    report = pd.concat([coil_columns.reset_index(drop=True), report], axis=1)
+    report['MC_FreqSpread'] = report['MC_FreqStd'] / report['MC_FreqMean']
+    return report
+
+def tolerance_analysis(input_csv, freq_band=None, top_n=5, samples=10000, tolerances=None, distribution='normal', params=None, seed=0):
+    """monte_carlo on the top_n coils of a sweep, ranked like top_five_options.
+
+    Without params a store's coils are modelled with the sweep params it was written with.
+    """
+    df = input_csv if isinstance(input_csv, pd.DataFrame) else load_table(input_csv)
+    if params is None and not isinstance(input_csv, pd.DataFrame):
+        params = store_params(input_csv)
+    shortlist = top_k(df, list(cps.TOP_OPTIONS_BY), top_n)
+    return monte_carlo(shortlist, freq_band, samples, tolerances, distribution, params, seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo manufacturing tolerance analysis of the top coils of a sweep")
+    parser.add_argument('table', help="Sweep csv file or result store")
+    parser.add_argument('--band', type=float, nargs=2, metavar=('LOW', 'HIGH'), help="Sensor frequency band, defaults to nominal +/-10%%")
+    parser.add_argument('--top', type=int, default=5, help="Coils analysed")
+    parser.add_argument('--samples', type=int, default=10000, help="Samples per coil")
+    parser.add_argument('--width-tol', type=float, default=TOLERANCES['trace_width'], help="Trace width tolerance in um")
+    parser.add_argument('--spacing-tol', type=float, default=TOLERANCES['trace_spacing'], help="Trace spacing tolerance in um")
+    parser.add_argument('--copper-tol', type=float, default=TOLERANCES['copper_thickness'], help="Relative copper thickness tolerance")
+    parser.add_argument('--cap-tol', type=float, default=TOLERANCES['tank_cap'], help="Relative tank capacitor tolerance")
+    parser.add_argument('--distribution', choices=('normal', 'uniform'), default='normal')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    tolerances = {'trace_width': args.width_tol, 'trace_spacing': args.spacing_tol, 'copper_thickness': args.copper_tol, 'tank_cap': args.cap_tol}
+    report = tolerance_analysis(args.table, args.band, args.top, args.samples, tolerances, args.distribution, seed=args.seed)
+    print(report.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()